@@ -0,0 +1,64 @@
+#Erkennung einer ruhenden Strömung, damit step() nicht alle FFTs und Interpolationen auf einem Nullfeld rechnet
+#Zustände:
+#   "active"  normaler Schritt
+#   "quiet"   Geschwindigkeit und Kräfte unter der Schwelle: sie werden auf 0 gesetzt, Advektion und Projektion
+#             entfallen, nur Dichte und Farbstoffe schwächen sich ab (und diffundieren, wenn visc > 0)
+#   "idle"    zusätzlich die Dichte unter der Schwelle: sie wird auf 0 gesetzt, der Schritt tut nichts mehr
+#             (auch mit verbliebener Geschwindigkeit, solange es keine Kräfte, keine Dichte und keine Teilchen gibt)
+#Jede Eingabe (splat_density, splat_dye, splat_force, resize) weckt den Tracker sofort über fluid.wake().
+#Geprüft wird nur alle check_every Schritte (ein paar Maximum-Reduktionen), im Ruhezustand gar nicht.
+
+
+class ActivityTracker:
+
+    def __init__(self, velocity=1e-4, force=1e-6, density=1e-3, check_every=10):
+        self.velocity = velocity        # Schwelle für max(|u|, |v|) in Zellen pro Zeit
+        self.force = force              # Schwelle für max(|uforce|, |vforce|)
+        self.density = density          # Schwelle für die größte Dichte bzw. Farbstoffkonzentration
+        self.check_every = check_every  # Schritte zwischen zwei Prüfungen, solange nicht "idle"
+        self.mode = "active"
+        self.countdown = check_every
+        self.skipped = 0                # Schritte, die verbilligt oder ausgelassen wurden
+
+    #neue Eingabe: sofort wieder normal rechnen, frühestens nach check_every Schritten erneut prüfen
+    def wake(self):
+        self.mode = "active"
+        self.countdown = self.check_every
+
+    #Zustand für den nächsten Schritt bestimmen, setzt Felder unter der Schwelle auf 0
+    def update(self, fluid):
+        if self.mode == "idle":
+            self.skipped += 1
+            return self.mode
+        self.countdown -= 1
+        if self.countdown <= 0:
+            self.countdown = self.check_every
+            self.mode = self.classify(fluid)
+        if self.mode != "active":
+            self.skipped += 1
+        return self.mode
+
+    #Geschwindigkeit, Kräfte und Skalare mit den Schwellen vergleichen
+    def classify(self, fluid):
+        force = max(fluid.uforce.max(), -fluid.uforce.min(), fluid.vforce.max(), -fluid.vforce.min())
+        if force >= self.force:
+            return "active"
+        scalars = fluid.state[2:]
+        faint = max(scalars.max(), -scalars.min()) < self.density
+        tracers = fluid.particles is not None and fluid.particles.count > 0
+        if fluid.max_velocity() >= self.velocity:
+            #bei visc = 0 klingt die Geschwindigkeit nie ganz ab, ohne Dichte, Farbstoff und Teilchen bewegt sie aber
+            #nichts Sichtbares mehr: die Restströmung bleibt stehen und läuft nach der nächsten Eingabe weiter
+            if not faint or tracers:
+                return "active"
+            fluid.uforce.fill(0)
+            fluid.vforce.fill(0)
+            scalars.fill(0)
+            return "idle"
+        fluid.state[:2].fill(0)
+        fluid.uforce.fill(0)
+        fluid.vforce.fill(0)
+        if not faint:
+            return "quiet"
+        scalars.fill(0)
+        return "idle"
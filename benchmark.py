@@ -0,0 +1,211 @@
+#Benchmark der einzelnen Schritte des Lösers für verschiedene Gittergrößen
+#misst kalte (erster Aufruf, leere Caches) und warme Laufzeit, Zellen pro Sekunde und Spitzenspeicher
+#Ergebnisse werden als JSON geschrieben und können mit einer gespeicherten Baseline verglichen werden
+#
+#Beispiel:
+#   python benchmark.py --sizes 64 128 256 512 1024 --output results.json
+#   python benchmark.py --baseline results.json --tolerance 0.15
+#   python benchmark.py --sizes 1024 --stages step --threads 1 4 16     (Speedup und parallele Effizienz)
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import fluid_functions as ff
+from fluid_class import FluidSimulation
+from particles import TracerParticles
+
+
+#Gecachte Spektraloperatoren leeren, damit der kalte Aufruf sie neu aufbauen muss
+def clear_caches():
+    ff.rfft_wavenumbers.cache_clear()
+    ff.diffusion_operator.cache_clear()
+    ff.projection_operator.cache_clear()
+    ff.brush_kernel.cache_clear()
+    ff.wrap_tables.cache_clear()
+
+
+#Zufällige Felder und eine Simulation als Eingabe für die Benchmarks einer Gittergröße
+def make_inputs(N, dt=0.3, visc=0.001, seed=0, threads=1):
+    rng = np.random.default_rng(seed)
+    fluid = FluidSimulation(N, dt, visc, threads=threads)
+    fluid.u = rng.standard_normal(fluid.shape).astype(np.float32)
+    fluid.v = rng.standard_normal(fluid.shape).astype(np.float32)
+    fluid.density = rng.random(fluid.shape).astype(np.float32)
+    fluid.uforce = rng.standard_normal(fluid.shape).astype(np.float32)
+    fluid.vforce = rng.standard_normal(fluid.shape).astype(np.float32)
+    return fluid
+
+
+#Tracer-Teilchen (N² Stück, gleichmäßig verteilt) für die Stufe "particles"
+def make_particles(N, seed=0):
+    rng = np.random.default_rng(seed)
+    particles = TracerParticles(N, N * N, seed=seed)
+    particles.emit(rng.integers(0, N, N * N), rng.integers(0, N, N * N))
+    return particles
+
+
+#Die gemessenen Stufen: Name -> Funktion, die aus der Simulation einen Aufruf baut
+def stages(fluid):
+    N, dt, visc = fluid.N, fluid.dt, fluid.visc
+    u, v, density = fluid.u.copy(), fluid.v.copy(), fluid.density.copy()
+    coordinates = fluid.coordinates
+    advected = np.empty_like(fluid.state)       #advect_fields mit den Arbeitspuffern der Simulation wie in step()
+    particles = make_particles(N)
+    return {
+        "advect_velocity": lambda: ff.advect_velocity(u, u, v, coordinates, dt, N),
+        "advect_density": lambda: ff.advect_density(density, u, v, coordinates, dt, N),
+        "advect_fields": lambda: ff.advect_fields(fluid.state, u, v, coordinates, dt, N, fluid.order, out=advected,
+                                                  points=(fluid.Xb, fluid.Yb), stencil=fluid.stencil, work=fluid.work,
+                                                  run=fluid.parallel if fluid.pool is not None else None,
+                                                  blocks=fluid.blocks),
+        "add_force": lambda: ff.add_force(u.copy(), dt, fluid.uforce),
+        "diffuse": lambda: ff.diffuse(u, visc, dt, fluid.K_sq),
+        "project": lambda: ff.project(u, v, fluid.KX, fluid.KY, fluid.K_sq),
+        "diffuse_project": lambda: ff.diffuse_project(u, v, visc, dt, workers=fluid.threads),
+        "splat": lambda: fluid.splat_density(N // 2, N // 2, max(1, N * 35 // 1000)),
+        "particles": lambda: particles.advect(u, v, dt),
+        "step": fluid.step,
+    }
+
+
+#Spitzenspeicher (Bytes), den ein Aufruf zusätzlich anlegt
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+#Misst eine Stufe: kalter Aufruf, dann repeat warme Aufrufe nach warmup Aufwärmrunden
+def measure(name, N, repeat, warmup, threads=1):
+    clear_caches()
+    fluid = make_inputs(N, threads=threads)
+    fn = stages(fluid)[name]
+
+    start = time.perf_counter()
+    fn()
+    cold = time.perf_counter() - start
+
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    warm = float(np.median(times))
+    peak = peak_memory(fn)
+    fluid.set_threads(1)        #Thread-Pool beenden
+
+    return {
+        "stage": name,
+        "N": N,
+        "threads": threads,
+        "cold_s": cold,
+        "warm_s": warm,
+        "warm_min_s": float(np.min(times)),
+        "cells_per_s": N * N / warm if warm > 0 else float("inf"),
+        "peak_bytes": peak,
+    }
+
+
+#nur diese Stufen nutzen den Thread-Pool bzw. workers, die übrigen laufen immer mit einem Thread
+THREADED_STAGES = ("advect_fields", "diffuse_project", "step")
+
+
+def run(sizes, names=None, repeat=10, warmup=2, threads=(1,)):
+    names = names or list(stages(make_inputs(8)))
+    results = []
+    for N in sizes:
+        for name in names:
+            counts = threads if name in THREADED_STAGES else threads[:1]      #weitere Thread-Zahlen würden dasselbe messen
+            for count in counts:
+                results.append(measure(name, N, repeat, warmup, count))
+                r = results[-1]
+                print(f"{name:>16} N={N:<5} t={count:<3} cold={r['cold_s']*1e3:9.3f} ms  warm={r['warm_s']*1e3:9.3f} ms  "
+                      f"{r['cells_per_s']/1e6:8.2f} Mcells/s  peak={r['peak_bytes']/2**20:7.2f} MiB")
+    add_scaling(results)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+            "warmup": warmup,
+        },
+        "results": results,
+    }
+
+
+#Speedup und parallele Effizienz (Zeit mit 1 Thread / (threads * Zeit)) für Messungen mit mehreren Threads
+#nur für Stufen, die Threads tatsächlich nutzen
+def add_scaling(results):
+    single = {(r["stage"], r["N"]): r["warm_s"] for r in results if r["threads"] == 1}
+    for r in results:
+        reference = single.get((r["stage"], r["N"]))
+        if r["threads"] == 1 or reference is None or r["stage"] not in THREADED_STAGES:
+            continue
+        r["speedup"] = reference / r["warm_s"]
+        r["efficiency"] = r["speedup"] / r["threads"]
+        print(f"{r['stage']:>16} N={r['N']:<5} t={r['threads']:<3} speedup={r['speedup']:5.2f}  "
+              f"efficiency={r['efficiency']:.0%}")
+
+
+#Vergleicht warme Zeiten mit einer Baseline, gibt die Stufen zurück, die um mehr als tolerance langsamer sind
+def compare(results, baseline, tolerance=0.10):
+    reference = {(r["stage"], r["N"], r.get("threads", 1)): r for r in baseline["results"]}
+    regressions = []
+    for r in results["results"]:
+        ref = reference.get((r["stage"], r["N"], r["threads"]))
+        if ref is None:
+            continue
+        ratio = r["warm_s"] / ref["warm_s"]
+        if ratio > 1 + tolerance:
+            regressions.append({"stage": r["stage"], "N": r["N"], "threads": r["threads"], "ratio": ratio,
+                                "warm_s": r["warm_s"], "baseline_s": ref["warm_s"]})
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the solver stages across grid sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 128, 256, 512, 1024])
+    parser.add_argument("--stages", nargs="+", help="only run these stages")
+    parser.add_argument("--repeat", type=int, default=10, help="timed warm calls per stage")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed calls before the warm timing")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1], help="thread counts to measure (include 1 for efficiency)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown before a regression is flagged")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args.sizes, args.stages, args.repeat, args.warmup, args.threads)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r['stage']} N={r['N']} threads={r['threads']}: {r['warm_s']*1e3:.3f} ms vs "
+                  f"{r['baseline_s']*1e3:.3f} ms ({r['ratio']:.2f}x)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#Spektrale Kenngrößen der Strömung aus den Spektren, die diffuse_project ohnehin berechnet (keine zusätzliche FFT)
+#Mit norm='ortho' gilt Parseval ohne Faktoren: Summe |f|² im Ortsraum = Summe |f̂|² über das volle Spektrum,
+#auf dem halben rfft2-Gitter zählen die Spalten 1..N/2-1 doppelt (Gewicht aus spectrum_shells).
+#Alle Werte sind Mittelwerte pro Zelle:
+#   energy      kinetische Energie ½<u²+v²>
+#   spectrum    isotropes Energiespektrum E(k), k = ganzzahliger Betrag der Wellenzahl, Summe über k = energy
+#   enstrophy   ½<ω²> mit ω = ∂v/∂x - ∂u/∂y
+#   divergence  RMS der Divergenz nach der Projektion (Rundungsfehler, sollte ~1e-7 sein)
+#   mass        Summe der Dichte nach dem Schritt (Ortsraum, eine Reduktion)
+#Die Werte liegen in Ringpuffern der Länge window, für Ensembles mit einem Wert pro Mitglied.
+
+from functools import lru_cache
+import numpy as np
+from fluid_functions import rfft_wavenumbers, spectrum_shells
+
+
+#Tabellen für die Auswertung auf dem halben rfft2-Gitter (N, M), M = N//2+1, gecached pro N:
+#   KX2, KY2   Wellenzahlen für Ableitungen, je Eintrag doppelt (Real- und Imaginärteil eines complex64 als float32 View),
+#              Nyquist-Zeile und -Spalte haben keine eindeutige Ableitung (die Projektion lässt dort den gemischten
+#              Term weg) und werden mit 0 angesetzt
+#   order      Zellen nach Schale sortiert, starts: Beginn jeder Schale in order (für np.add.reduceat)
+#   weights    Gewicht der Zellen in der Reihenfolge von order
+#   K2W        Gewicht * k² für die Enstrophie, single: Spalten mit Gewicht 1
+@lru_cache(maxsize=8)
+def diagnostic_tables(N):
+    KX, KY, _ = rfft_wavenumbers(N)
+    shell, weight, shells = spectrum_shells(N)
+    KX, KY = KX.copy(), KY.copy()
+    single = [0]
+    if N % 2 == 0:
+        for K in (KX, KY):
+            K[:, -1] = 0
+            K[N // 2, :] = 0
+        single.append(N // 2)
+    order = np.argsort(shell.reshape(-1), kind='stable')
+    starts = np.searchsorted(shell.reshape(-1)[order], np.arange(shells))
+    tables = {
+        "KX2": np.repeat(KX, 2, axis=-1),
+        "KY2": np.repeat(KY, 2, axis=-1),
+        "order": order,
+        "starts": starts,
+        "weights": weight.reshape(-1)[order],
+        "K2W": ((KX**2 + KY**2) * weight).reshape(-1),
+        "single": tuple(single),
+    }
+    for array in tables.values():
+        if isinstance(array, np.ndarray):
+            array.flags.writeable = False
+    return tables
+
+
+#gewichtete Summe Σ w|d̂|² eines Spektrums, d als float32 View (N, 2M): alle Spalten doppelt, die Spalten in single einfach
+#np.dot auf zusammenhängenden float32 Arrays läuft über BLAS ohne Zwischenarray
+def weighted_norm(d, single):
+    flat = d.reshape(-1)
+    total = 2 * float(np.dot(flat, flat))
+    for column in single:
+        values = d[:, 2 * column:2 * column + 2].reshape(-1)
+        total -= float(np.dot(values, values))
+    return total
+
+
+class SpectralDiagnostics:
+
+    NAMES = ("energy", "enstrophy", "divergence", "mass")
+
+    def __init__(self, window=600, every=1):
+        self.window = window        # Anzahl der letzten Messungen im Ringpuffer
+        self.every = every          # nur in jedem every-ten Schritt auswerten
+        self.calls = 0              # Schritte seit Beginn (für every)
+        self.count = 0              # Anzahl der Messungen insgesamt
+        self.shape = None           # Form der Spektren, bei Änderung (resize) werden die Puffer neu angelegt
+        self.values = {}            # Name -> Ringpuffer (window, ...)
+        self.spectrum = None        # Ringpuffer (window, ..., Schalen)
+        self.steps = None           # Schritt (calls) jeder Messung
+
+    #soll im aktuellen Schritt ausgewertet werden?
+    def due(self):
+        self.calls += 1
+        return (self.calls - 1) % self.every == 0
+
+    def allocate(self, shape):
+        N = shape[-2]
+        _, _, shells = spectrum_shells(N)
+        batch = shape[:-2]
+        self.shape = shape
+        self.count = 0
+        self.values = {name: np.zeros((self.window,) + batch) for name in self.NAMES}
+        self.spectrum = np.zeros((self.window,) + batch + (shells,))
+        self.steps = np.zeros(self.window, dtype=np.int64)
+        self.square = np.empty(shape[:-1] + (2 * shape[-1],), dtype=np.float32)     #|Re|², |Im|² je Zelle
+        self.power = np.empty(shape, dtype=np.float32)
+        self.gathered = np.empty(N * shape[-1], dtype=np.float32)
+
+    #Energie, E(k), Enstrophie und Divergenz aus den projizierten Spektren (aus diffuse_project, vor der Rücktransformation)
+    #work: zwei freie komplexe Spektren gleicher Form als Zwischenspeicher
+    #gerechnet wird auf float32 Views der complex64 Spektren, das spart die langsamen gemischten complex*float Operationen
+    def velocity(self, u_hat, v_hat, work):
+        if u_hat.shape != self.shape:
+            self.allocate(u_hat.shape)
+        N = u_hat.shape[-2]
+        tables = diagnostic_tables(N)
+        slot = self.count % self.window
+        scale = 0.5 / N**2
+        U, V = u_hat.view(np.float32), v_hat.view(np.float32)
+        a, b = (spectrum.view(np.float32) for spectrum in work)
+
+        #Leistung |û|² + |v̂|² pro Zelle
+        np.square(U, out=self.square)
+        np.square(V, out=a)
+        self.square += a
+        np.add(self.square[..., 0::2], self.square[..., 1::2], out=self.power)
+
+        #Divergenz d̂ = i(kx û + ky v̂), der Faktor i fällt im Betrag weg
+        np.multiply(tables["KX2"], U, out=a)
+        np.multiply(tables["KY2"], V, out=b)
+        a += b
+
+        #Views auf die Einträge dieses Schritts, ein Wert pro Mitglied (slot:slot+1, damit es auch ohne Ensemble ein View ist)
+        energy, enstrophy, divergence = (self.values[name][slot:slot + 1].reshape(-1)
+                                         for name in ("energy", "enstrophy", "divergence"))
+        spectra = self.spectrum[slot].reshape(len(energy), -1)
+        power = self.power.reshape(len(energy), -1)
+        d = a.reshape((len(energy),) + a.shape[-2:])
+        for member in range(len(energy)):
+            #E(k): Zellen nach Schalen sortiert einsammeln und je Schale aufsummieren
+            np.take(power[member], tables["order"], out=self.gathered)
+            self.gathered *= tables["weights"]
+            spectra[member] = scale * np.add.reduceat(self.gathered, tables["starts"])
+            energy[member] = spectra[member].sum()
+
+            #|ω̂|² + |d̂|² = k²(|û|² + |v̂|²), die Enstrophie folgt also aus der Leistung und der Divergenz
+            div = weighted_norm(d[member], tables["single"])
+            enstrophy[member] = scale * (float(np.dot(power[member], tables["K2W"])) - div)
+            divergence[member] = np.sqrt(2 * scale * div)
+
+    #Messung mit der Dichtemasse nach dem Schritt abschließen
+    def finish(self, density):
+        slot = self.count % self.window
+        self.values["mass"][slot] = density.sum(axis=(-2, -1))        #float32, numpy summiert paarweise
+        self.steps[slot] = self.calls - 1
+        self.count += 1
+
+    #letzte Messung als dict (Name -> Wert bzw. Array pro Mitglied, "spectrum" -> E(k)), None wenn noch keine vorliegt
+    def latest(self):
+        if self.count == 0:
+            return None
+        slot = (self.count - 1) % self.window
+        result = {name: values[slot] for name, values in self.values.items()}
+        result["spectrum"] = self.spectrum[slot]
+        result["step"] = int(self.steps[slot])
+        return result
+
+    #Verlauf einer Größe ("energy", ..., "spectrum", "steps") in zeitlicher Reihenfolge, höchstens window Einträge
+    def history(self, name):
+        if self.count == 0:
+            return np.zeros(0)
+        buffer = {"spectrum": self.spectrum, "steps": self.steps}.get(name)
+        if buffer is None:
+            buffer = self.values[name]
+        if self.count <= self.window:
+            return buffer[:self.count].copy()
+        return np.roll(buffer, -(self.count % self.window), axis=0)
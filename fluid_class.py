@@ -1,92 +1,372 @@
 #Klasse der Simulation für das Fluid, hier werden Werte initialisiert und der Algorithmus definiert
 
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from fluid_functions import *
+from profiling import StageProfiler
+from particles import TracerParticles
+from diagnostics import SpectralDiagnostics
+from activity import ActivityTracker
+
+
+#Property für ein Feld, das als View in einem der Zustandspuffer liegt
+#Zuweisung kopiert in den Puffer, damit die Puffer fest bleiben (z.B. fluid.density = gaussian_filter(...))
+def field_view(buffer, index):
+    def get(self):
+        return getattr(self, buffer)[index]
+
+    def set(self, value):
+        getattr(self, buffer)[index][...] = value
+
+    return property(get, set)
 
 
 class FluidSimulation:
 
-    def __init__(self, N, dt, visc):
-        self.N = N               # Gittergröße (Anzahl der Zellen)
+    #Felder u, v, density liegen in state (3 + C, N, N), die Werte des letzten Schritts in state_prev
+    #dahinter folgen C passive Farbstoffe dyes (C, N, N), die wie die Dichte transportiert werden
+    #bei einem Ensemble (batch_shape=(B,)) haben alle Felder die Form (B, N, N)
+    u = field_view('state', 0)
+    v = field_view('state', 1)
+    density = field_view('state', 2)
+    dyes = field_view('state', slice(3, None))
+    u_prev = field_view('state_prev', 0)
+    v_prev = field_view('state_prev', 1)
+    density_prev = field_view('state_prev', 2)
+    dyes_prev = field_view('state_prev', slice(3, None))
+
+    def __init__(self, N, dt, visc, order=1, batch_shape=(), threads=1, dyes=0):
         self.dt = dt             # Zeitschritt
         self.visc = visc         # Viskosität
-        self.center = N//2     # Mittelpunkt des Gitters
+        self.order = order       # Interpolationsordnung der Advektion (1 = bilinear)
         self.force = 0.0         # Kraftintensität
         self.draw_velocity = False  # für Visualisierung der Vektoren
-        self.scaling_factor = 800 / self.N  # Skalierungsfaktor für die Darstellung
-        self.shape = (self.N, self.N)   #shape der Felder
+        self.cfl = None          # CFL-Ziel (Zellen pro Teilschritt) für advance(), None = fester Zeitschritt
+        self.max_substeps = 8    # höchstens so viele Teilschritte pro advance()
+        self.interval = None     # Simulationszeit pro advance(), None = self.dt (mit cfl auch größer als dt sinnvoll)
+        self.capped_steps = 0    # advance() Aufrufe, in denen max_substeps das CFL-Ziel verfehlt hat
+        self.last_cfl = 0.0      # tatsächliche Bewegung in Zellen pro Teilschritt im letzten advance() (mit cfl)
+        self.last_dt = dt        # zuletzt von advance() gewählter Zeitschritt
+        self.last_substeps = 0   # Teilschritte im letzten advance()
+        self.total_substeps = 0  # Teilschritte insgesamt
+        self.open_substeps = 0   # Teilschritte, die im laufenden advance() noch folgen (0: nach diesem step() ist der
+                                 # ganze Schritt fertig, z.B. für Checkpoints in recorder.py)
+        self.sim_time = 0.0      # simulierte Zeit aus advance()
+        self.batch_shape = tuple(batch_shape)
+        self.channels = 3 + dyes # Felder in state: u, v, Dichte und die Farbstoffe
+        self.dye_decay = np.full(dyes, 0.999, dtype=np.float32)      # Abschwächung pro Schritt je Farbstoff
+        self.threads = 1         # Threads für FFTs und Advektion, siehe set_threads
+        self.pool = None         # persistenter Thread-Pool für die Zeilenblöcke (nur bei threads > 1)
+        self.parallel_efficiency = None   # Auslastung der Threads in den parallelen Phasen des letzten Schritts
+        self.parallel_busy = 0.0          # Rechenzeit der Aufgaben auf dem Thread-Pool im laufenden Schritt
+        self.parallel_wall = 0.0          # Wandzeit der parallelen Phasen im laufenden Schritt
+        self.particles = None    # Tracer-Teilchen, siehe add_particles
+        self.diagnostics = None  # spektrale Kenngrößen (Energie, E(k), ...), siehe add_diagnostics
+        self.activity = None     # Erkennung ruhender Strömung, siehe add_activity_tracker
+        self.set_grid(N)
+        self.set_threads(threads)
 
-        # Grid Setup
-        x = (np.arange(self.N) + 0.5)
-        y = (np.arange(self.N) + 0.5)
-        self.X, self.Y = np.meshgrid(x, y, indexing='xy')
-        self.coordinates = np.dstack((self.X, self.Y))      # 3D-Array mit X,Y-Koordinaten
+        # Zeitmessung der Phasen von step()
+        self.profiler = StageProfiler()
 
-        # Wellenzahlen für Advekt und Projektionsschritt im Frequenzraum
-        kx = 2 * np.pi * np.fft.fftfreq(self.N)        #Wellenzahlen
-        ky = 2 * np.pi * np.fft.fftfreq(self.N)
-        #, d=h
-        self.KX, self.KY = np.meshgrid(kx, ky, indexing='xy')
-        self.K_sq = (self.KX**2 + self.KY**2).astype(np.float32)    #k² berechnen
-        self.K_sq[0, 0] = 1     #teilen durch 0 verhindern
+    #Gitter der Größe N einrichten: Geometrie aus dem Cache, Felder (mit Null) und Arbeitspuffer neu anlegen
+    def set_grid(self, N):
+        self.N = N               # Gittergröße (Anzahl der Zellen)
+        self.center = N//2     # Mittelpunkt des Gitters
+        self.scaling_factor = 800 / self.N  # Skalierungsfaktor für die Darstellung
+        self.shape = self.batch_shape + (self.N, self.N)   #shape der Felder
 
+        # Grid Setup und Wellenzahlen für Advekt und Projektionsschritt im Frequenzraum (gecached pro N)
+        self.X, self.Y, self.coordinates, self.KX, self.KY, self.K_sq = grid_geometry(self.N)
 
         # Initialisierung der Felder
-
-        self.u = np.zeros(self.shape, dtype=np.float32)
-        self.u_prev = np.zeros(self.shape, dtype=np.float32)
-        self.v = np.zeros(self.shape, dtype=np.float32)
-        self.v_prev = np.zeros(self.shape, dtype=np.float32)
-        self.density = np.zeros(self.shape, dtype=np.float32)
-        self.density_prev = np.zeros(self.shape, dtype=np.float32)
+        self.state = np.zeros((self.channels,) + self.shape, dtype=np.float32)         #u, v, Dichte, Farbstoffe
+        self.state_prev = np.zeros((self.channels,) + self.shape, dtype=np.float32)
         self.uforce = np.zeros(self.shape, dtype=np.float32)
         self.vforce = np.zeros(self.shape, dtype=np.float32)
 
+        # Arbeitspuffer, damit step() keine neuen Arrays anlegt
+        self.work = np.empty((self.channels,) + self.shape, dtype=np.float32)
+        self.Xb = np.empty(self.shape, dtype=np.float32)                   #Rückwärtspositionen
+        self.Yb = np.empty(self.shape, dtype=np.float32)
+        self.stencil = empty_stencil(self.shape)                           #bilineare Indizes und Gewichte
+        self.spectra = empty_spectra(self.shape, max(4, self.channels - 2))  #complex64 Spektren (auch für Dichte + Farbstoffe)
+        self.blocks = row_blocks(self.shape, self.threads)                 #Zeilenblöcke für die parallele Advektion
+
+    #Anzahl der Threads: FFTs laufen dann über scipy.fft mit workers=threads, Rückwärtsposition und Interpolation
+    #in Zeilenblöcken auf einem Thread-Pool, der bis zum nächsten Aufruf bestehen bleibt. 1 = alles im aufrufenden Thread
+    def set_threads(self, threads):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.threads = max(1, int(threads))
+        if self.threads > 1:
+            self.pool = ThreadPoolExecutor(self.threads, thread_name_prefix="fluid-worker")
+        self.blocks = row_blocks(self.shape, self.threads)
+        self.parallel_efficiency = None
+
+    #fn(item) für alle items auf dem Thread-Pool ausführen
+    #misst die Rechenzeit der Aufgaben, Auslastung = Rechenzeit / (threads * Wandzeit), über einen Schritt summiert
+    def parallel(self, fn, items):
+        def timed(item):
+            start = time.perf_counter()
+            fn(item)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.parallel_busy += sum(self.pool.map(timed, items))
+        self.parallel_wall += time.perf_counter() - start
+
+    #Auflösung auf N ändern und den Zustand mitnehmen: u, v, Dichte und Kräfte werden spektral umgerechnet
+    #Geschwindigkeiten und Kräfte sind in Zellen pro Zeit und werden daher mit N_neu/N_alt skaliert
+    def resize(self, N):
+        N = int(N)
+        if N == self.N:
+            return
+        scale = N / self.N
+        state = resample_spectral(self.state, N)
+        forces = resample_spectral(np.stack((self.uforce, self.vforce)), N)
+        state[:2] *= scale
+        forces *= scale
+        np.clip(state[2:], 0.0, None, out=state[2:])       #Überschwinger am Rand von Dichte- und Farbflecken
+
+        self.set_grid(N)
+        self.state[...] = state
+        self.uforce[...] = forces[0]
+        self.vforce[...] = forces[1]
+        if self.particles is not None:
+            self.particles.rescale(N)
+        self.profiler.reset()                               #Zeiten der alten Auflösung verwerfen
+        self.wake()
+
     #Führt einen step der Simulation durch
-    def step(self):
+    #die Phasen werden vom profiler gemessen: advection, forcing, projection (Diffusion + Projektion), density
+    #dt: Zeitschritt für diesen Schritt (Standard self.dt), das Abschwächen von Kräften und Dichte wird
+    #dann auf den Anteil fraction (Standard dt/self.dt, siehe step_fraction) eines ganzen Schritts umgerechnet,
+    #damit Teilschritte zusammen wie ein ganzer Schritt wirken
+    #mit einem ActivityTracker entfallen bei ruhender Strömung Advektion und Projektion (siehe activity.py)
+    def step(self, dt=None, fraction=None):
+        stage = self.profiler.stage
+        if dt is None:
+            dt = self.dt
+            fraction = None
+            force_decay = 0.8
+            density_decay = 0.999
+        else:
+            if fraction is None:
+                fraction = self.step_fraction(dt)
+            force_decay = per_member(0.8 ** fraction)
+            density_decay = per_member(0.999 ** fraction)
+
+        mode = "active" if self.activity is None else self.activity.update(self)
+        with stage("step"):
+            if mode != "active":
+                #Geschwindigkeit und Kräfte sind 0: nur Dichte und Farbstoffe abschwächen, diffundieren nur bei visc > 0
+                if mode == "quiet":
+                    with stage("density"):
+                        self.update_scalars(dt, fraction, density_decay, diffuse=bool(np.any(self.visc)))
+                if self.particles is not None:
+                    self.particles.age_by(np.float32(dt))
+                return
+
+            #aktuellen Zustand zum vorherigen machen, Puffer tauschen statt kopieren
+            self.state, self.state_prev = self.state_prev, self.state
 
-        #Speichern von aktuellen Zuständen
-        self.u_prev = self.u.copy()
-        self.v_prev = self.v.copy()
-        self.density_prev = self.density.copy()
+            #Advektion von Geschwindigkeit, Dichte und Farbstoffen mit einer gemeinsamen Rückwärtsposition
+            with stage("advection"):
+                self.parallel_busy = self.parallel_wall = 0.0
+                advect_fields(self.state_prev, self.u_prev, self.v_prev, self.coordinates, dt, self.N, self.order,
+                              out=self.state, points=(self.Xb, self.Yb), stencil=self.stencil, work=self.work,
+                              run=self.parallel if self.pool is not None else None, blocks=self.blocks)
+                if self.pool is not None and self.parallel_wall > 0:
+                    self.parallel_efficiency = self.parallel_busy / (self.threads * self.parallel_wall)
 
-        #Advektion von Vektorfeldern
-        self.u = advect_velocity(self.u, self.u_prev, self.v_prev,
-                       self.coordinates, self.dt, self.N)
-        self.v = advect_velocity(self.v, self.u_prev, self.v_prev,
-                       self.coordinates, self.dt, self.N)
+            #Kräfte hinzufügen (Ergebnis in den Arbeitspuffern)
+            with stage("forcing"):
+                add_force(self.u, dt, self.uforce, out=self.work[0])
+                add_force(self.v, dt, self.vforce, out=self.work[1])
+                self.uforce *= force_decay      #Kräfte mir der Zeit abschwächen
+                self.vforce *= force_decay
 
-        #Kräfte hinzufügen
-        self.u = add_force(self.u, self.dt, self.uforce)
-        self.v = add_force(self.v, self.dt, self.vforce)
-        self.uforce *= 0.8      #Kräfte mir der Zeit abschwächen
-        self.vforce *= 0.8
+            #Diffusion und Projektion in einem Schritt im Frequenzraum (rfft2, float32/complex64)
+            #Viskositätseffekte und Sicherstellen der Divergenzfreiheit
+            diagnostics = self.diagnostics if self.diagnostics is not None and self.diagnostics.due() else None
+            with stage("projection"):
+                diffuse_project(self.work[0], self.work[1], self.visc, dt, out=(self.state[0], self.state[1]),
+                                work=self.spectra[:4], workers=self.threads, diagnostics=diagnostics)
 
-        #Diffusion von Vektorfeldern (Viskositätseffekte)
-        self.u = diffuse(self.u, self.visc, self.dt, self.K_sq)
-        self.v = diffuse(self.v, self.visc, self.dt, self.K_sq)
+            with stage("density"):
+                self.update_scalars(dt, fraction, density_decay)
+            if diagnostics is not None:
+                diagnostics.finish(self.density)
 
-        #Projektion - Sicherstellen der Divergenzfreiheit
-        self.u, self.v = project(self.u, self.v, self.KX, self.KY, self.K_sq)
+            #Tracer-Teilchen mit dem neuen Geschwindigkeitsfeld bewegen
+            if self.particles is not None:
+                with stage("particles"):
+                    self.particles.advect(self.u, self.v, dt)
 
-        #Dichte bewegen und Diffusionsgleichung lösen
-        self.density = advect_density(self.density_prev, self.u_prev, self.v_prev,
-                           self.coordinates, self.dt, self.N)
-        self.density = diffuse(self.density, self.visc* 0.1, self.dt, self.K_sq)        #geringere Diffusion der Dichte : visc*0.1
-        self.density *= 0.999         # Langsames Abschwächen der Dichte
+    #Diffusionsgleichung der Dichte (und der Farbstoffe, alle in einer rfft2) lösen und beide abschwächen
+    def update_scalars(self, dt, fraction, density_decay, diffuse=True):
+        if self.channels == 3:
+            if diffuse:
+                diffuse_spectral(self.density, self.visc * 0.1, dt,
+                                 out=self.density, work=self.spectra[0], workers=self.threads)        #geringere Diffusion der Dichte : visc*0.1
+        else:
+            scalars = self.state[2:]
+            if diffuse:
+                diffuse_spectral(scalars, self.visc * 0.1, dt,
+                                 out=scalars, work=self.spectra[:len(scalars)], workers=self.threads)
+            self.dyes *= self.dye_factors(fraction)
+        self.density *= density_decay         # Langsames Abschwächen der Dichte
+
+    #Anteil dt/self.dt eines Teilschritts am ganzen Schritt (auch ein Wert pro Ensemble-Mitglied)
+    #bei self.dt = 0 (Timestep-Slider am Minimum) gibt es keinen Bezug, dann gilt share: advance() übergibt
+    #1/Teilschritte, damit ein advance() wie ein ganzer Schritt abschwächt statt alles auf 0 zu setzen
+    def step_fraction(self, dt, share=1.0):
+        dt = np.asarray(dt, dtype=np.float32)
+        reference = np.asarray(self.dt, dtype=np.float32)
+        fraction = np.full(np.broadcast(dt, reference).shape, share, dtype=np.float32)
+        return np.divide(dt, reference, out=fraction, where=reference != 0)
+
+    #Abschwächung der Farbstoffe pro Schritt, Form (C, 1, ..., 1) zum Broadcasten über (C, ..., N, N)
+    #fraction: Anteil dt/self.dt eines Teilschritts (auch ein Wert pro Ensemble-Mitglied)
+    def dye_factors(self, fraction=None):
+        factors = self.dye_decay.reshape((-1,) + (1,) * len(self.shape))
+        if fraction is None:
+            return factors
+        return factors ** per_member(fraction)
+
+    #größte Geschwindigkeitskomponente max(|u|, |v|) in Zellen pro Zeit, über Minimum/Maximum ohne Zwischenarray
+    def max_velocity(self):
+        return float(max(self.u.max(), -self.u.min(), self.v.max(), -self.v.min()))
+
+    #Simulation um interval (Standard self.interval, sonst self.dt) weiterrechnen
+    #ohne cfl ein normaler Schritt, mit cfl (adaptiv) so viele gleich lange Teilschritte, dass sich kein Teilchen
+    #weiter als cfl Zellen pro Teilschritt bewegt (höchstens max_substeps). Gleich lange Teilschritte halten die
+    #Zahl der verschiedenen dt klein, so bleiben die gecachten Spektraloperatoren wiederverwendbar.
+    #Mit einem interval größer als dt macht ein ruhiger Fluss große Schritte und ein schneller viele kleine.
+    #Reicht max_substeps nicht für das CFL-Ziel, wird das in capped_steps gezählt (last_cfl ist dann größer als cfl)
+    #gibt die Anzahl der Teilschritte zurück, last_dt / last_substeps / sim_time zur Überwachung
+    def advance(self, interval=None):
+        if interval is None:
+            interval = self.dt if self.interval is None else self.interval
+        if self.cfl is None:
+            substeps = 1
+        else:
+            displacement = float(np.max(interval)) * self.max_velocity()
+            needed = max(1, int(np.ceil(displacement / self.cfl)))
+            substeps = min(self.max_substeps, needed)
+            self.last_cfl = displacement / substeps
+            if needed > substeps:
+                self.capped_steps += 1
+
+        dt = interval / substeps
+        for substep in range(substeps):
+            self.open_substeps = substeps - 1 - substep
+            if substeps == 1 and interval is self.dt:
+                self.step()
+            else:
+                self.step(dt, self.step_fraction(dt, 1 / substeps))
+
+        self.last_dt = dt
+        self.last_substeps = substeps
+        self.total_substeps += substeps
+        self.sim_time += float(np.max(interval))
+        return substeps
+
+    #ruhende Strömung überspringen (siehe activity.py), Schwellen für max|u,v|, max|Kraft| und die größte Dichte
+    def add_activity_tracker(self, velocity=1e-4, force=1e-6, density=1e-3, check_every=10):
+        self.activity = ActivityTracker(velocity, force, density, check_every)
+        return self.activity
+
+    #nach einer Eingabe wieder normal rechnen
+    def wake(self):
+        if self.activity is not None:
+            self.activity.wake()
+
+    #Dichte mit einem weichen Pinsel um die Zelle (x, y) einbringen (x = erste Achse wie in main.py)
+    #nur das Fenster um den Pinsel wird verändert, x, y und amount dürfen Arrays sein (mehrere Splats pro Frame)
+    #bei einem Ensemble bekommen alle Mitglieder denselben Abdruck (gilt auch für splat_dye und splat_force)
+    #sigma: Weichheit des Randes, Standard wie bisher der gaussian_filter in main.py
+    def splat_density(self, x, y, radius, amount=1.0, sigma=None):
+        if sigma is None:
+            sigma = self.N / 150
+        splat_max(self.density, x, y, brush_kernel(int(radius), float(sigma), self.N), amount)
+        self.wake()
+
+    #Tracer-Teilchen (höchstens capacity) anlegen, die ab jetzt in jedem Schritt mitbewegt werden
+    #lifetime: maximales Alter in Simulationszeit, None = bis der Pool voll ist und sie wiederverwendet werden
+    #order: 1 = Euler-Schritt, 2 = Mittelpunktregel (doppelte Kosten, genauer in Wirbeln)
+    def add_particles(self, capacity, lifetime=None, seed=None, order=1):
+        if self.batch_shape:
+            raise ValueError("tracer particles are only supported for a single simulation, not an ensemble")
+        self.particles = TracerParticles(self.N, capacity, lifetime, seed, order)
+        return self.particles
+
+    #count Tracer-Teilchen gaußverteilt (spread Zellen) um (x, y) erzeugen, benötigt add_particles
+    #weckt den ActivityTracker, sonst blieben neue Teilchen in einer ruhenden Restströmung stehen
+    def emit_particles(self, x, y, count=1, spread=0.0):
+        new = self.particles.emit(x, y, count, spread)
+        self.wake()
+        return new
+
+    #spektrale Kenngrößen in jedem every-ten Schritt aus den Spektren der Projektion berechnen (siehe diagnostics.py)
+    #window: Länge der Ringpuffer, lesen mit fluid.diagnostics.latest() oder .history(name)
+    def add_diagnostics(self, window=600, every=1):
+        self.diagnostics = SpectralDiagnostics(window, every)
+        return self.diagnostics
+
+    #Farbstoff channel mit dem Pinsel einbringen, sonst wie splat_density
+    def splat_dye(self, channel, x, y, radius, amount=1.0, sigma=None):
+        if sigma is None:
+            sigma = self.N / 150
+        splat_max(self.dyes[channel], x, y, brush_kernel(int(radius), float(sigma), self.N), amount)
+        self.wake()
+
+    #Kraft (fu, fv) mit einem weichen Pinsel um (x, y) setzen, fu wirkt auf u, fv auf v, auch als Arrays
+    def splat_force(self, x, y, radius, fu, fv, sigma=0.5):
+        kernel = brush_kernel(int(radius), float(sigma), self.N)
+        splat_blend(self.uforce, x, y, kernel, fu)
+        splat_blend(self.vforce, x, y, kernel, fv)
+        self.wake()
+
+    #Laufzeitstatistik der Phasen in Sekunden (last, mean, p95, max), siehe StageProfiler.stats
+    def timings(self):
+        return self.profiler.stats()
+
+    #Callbacks vor (name) und nach (name, sekunden) jeder Phase von step() registrieren
+    def add_stage_callbacks(self, before=None, after=None):
+        self.profiler.add_callbacks(before, after)
 
 
     #Setzt alle Felder zurück auf Null (Neustart der Simulation)
     def clear(self):
-        self.density = np.zeros(self.shape, dtype=np.float32)
-        self.u = np.zeros(self.shape, dtype=np.float32)
-        self.v = np.zeros(self.shape, dtype=np.float32)
-        self.uforce = np.zeros(self.shape, dtype=np.float32)
-        self.vforce = np.zeros(self.shape, dtype=np.float32)
+        self.state.fill(0)
+        self.state_prev.fill(0)
+        self.uforce.fill(0)
+        self.vforce.fill(0)
+        if self.particles is not None:
+            self.particles.clear()
 
     #Hilfsfunktion für Umschalten der Visualisierung der Geschwindigkeitsfelder
     def draw(self):
         self.draw_velocity = not self.draw_velocity
 
 
+#Ensemble von B unabhängigen Simulationen, die in einem Satz vektorisierter Aufrufe gerechnet werden
+#(FFTs über die letzten beiden Achsen, gemeinsamer Stencil mit Versatz pro Mitglied)
+#dt und visc können Skalare oder Arrays mit einem Wert pro Mitglied sein
+class BatchedFluidSimulation(FluidSimulation):
+
+    def __init__(self, B, N, dt, visc, order=1, threads=1, dyes=0):
+        self.B = B               # Anzahl der Ensemble-Mitglieder
+        super().__init__(N, dt, visc, order, batch_shape=(B,), threads=threads, dyes=dyes)
 
+    #dt und visc als float32 Array der Länge B speichern (oder Skalar, wenn für alle gleich)
+    def __setattr__(self, name, value):
+        if name in ('dt', 'visc') and np.ndim(value) > 0:
+            value = np.asarray(value, dtype=np.float32)
+            if value.shape != (self.B,):
+                raise ValueError(f"{name} needs one value per member, got shape {value.shape} for B={self.B}")
+        super().__setattr__(name, value)
@@ -1,17 +1,42 @@
 #Funktionen, welche zur Lösung der Navier-stokes Gleichung gebraucht werden
 
 import numpy as np
+from functools import lru_cache
+from scipy import fft as scipy_fft
 from scipy.ndimage import map_coordinates
+from scipy.special import erf
+
+
+#Alle Funktionen akzeptieren optional out= (vorallokierte Zielarrays), damit ein Simulationsschritt
+#ohne neue Allokationen auskommt. Ohne out wird wie bisher ein neues Array zurückgegeben.
+
+#dt und visc dürfen Skalare oder Arrays mit einem Wert pro Ensemble-Mitglied sein (Felder der Form (B, N, N))
+
+#Form (..., 1, 1), damit ein Wert pro Mitglied über die Gitterachsen broadcastet
+def per_member(value):
+    return np.asarray(value, dtype=np.float32)[..., None, None]
+
+
+#hashbarer Schlüssel für die gecachten Spektraloperatoren (float oder Tupel)
+def parameter_key(value):
+    if np.ndim(value) == 0:
+        return float(value)
+    return tuple(np.asarray(value, dtype=float).ravel().tolist())
 
 
 #Fügt einem Vektorfeld externe Kräfte hinzu
-def add_force(field, dt, force):
-        field += dt * force
-        return field
+#ohne out wird field direkt verändert, mit out (verschieden von field) entsteht kein Zwischenarray
+def add_force(field, dt, force, out=None):
+        if out is None or out is field:
+            field += per_member(dt) * force
+            return field
+        np.multiply(force, per_member(dt), out=out)
+        out += field
+        return out
 
 
 #Bewegt ein Dichtefeld entlang eines Geschwindigkeitsfeldes, Semi-Lagrange Advektion
-def advect_density(field, u_prev, v_prev, coordinates, dt, Gridsize):
+def advect_density(field, u_prev, v_prev, coordinates, dt, Gridsize, out=None):
     # Berechnet die Rückwärtsposition von Partikeln (Backtracing)
     Xb = (coordinates[:, :, 0] - dt * u_prev) % Gridsize
     Yb = (coordinates[:, :, 1] - dt * v_prev) % Gridsize
@@ -19,44 +44,313 @@ def advect_density(field, u_prev, v_prev, coordinates, dt, Gridsize):
     #interpolieren der Rückwärtsposition auf unser Gitter
     advected = map_coordinates(
     field,
-    [Yb.ravel() - 0.5, Xb.ravel() - 0.5],             #brauch 1D input, ravel statt flatten, da es keine kopie erzeugt sondern nur einen view
+    [Yb - 0.5, Xb - 0.5],             #2D Koordinaten, damit das Ergebnis direkt die Form des Feldes hat
+    output=out,
     order=1,
     mode='wrap'                                           # "wrap" für periodische randbedingung
-    ).reshape(field.shape)
+    )
 
     # Sicherstellen, dass keine negativen Werte (negative Dichte) entstehen
-    advected = np.clip(advected, 0.0, None)
+    advected = np.clip(advected, 0.0, None, out=advected)
 
     return advected
 
 
 #Bewegt Geschwindigkeitsfeld anhand des letzten Geschwindigkeitsfeldes
 #Wie advect_density. nur ohne das beschränken auf positive werte, da negative Geschwindigkeiten notwendig sind
-def advect_velocity(field, u_prev, v_prev, coordinates, dt, Gridsize):
+def advect_velocity(field, u_prev, v_prev, coordinates, dt, Gridsize, out=None):
     #Bewegt das Feld mit dem Geschwindigkeitsfeld
     Xb = (coordinates[:, :, 0] - dt * u_prev) % Gridsize
     Yb = (coordinates[:, :, 1] - dt * v_prev) % Gridsize
 
     advected = map_coordinates(
     field,
-    [Yb.ravel() - 0.5, Xb.ravel() - 0.5],
+    [Yb - 0.5, Xb - 0.5],
+    output=out,
     mode='wrap'
-    ).reshape(field.shape)
+    )
 
     return advected
 
+
+#Pinsel für lokale Eingaben (Dichte, Kraft): statt das ganze Feld zu glätten wird nur das betroffene Fenster verändert
+
+#Pinselkern: Quadrat mit halber Breite radius, gefaltet mit einer Gaußglocke (sigma), wie bisher Quadrat + gaussian_filter
+#shape (2h+1, 2h+1) mit h = radius + 3*sigma (höchstens (N-1)//2), gecached pro (radius, sigma, N)
+@lru_cache(maxsize=64)
+def brush_kernel(radius, sigma, Gridsize):
+    half = min(radius + int(np.ceil(3 * sigma)), (Gridsize - 1) // 2)
+    x = np.arange(-half, half + 1, dtype=np.float64)
+    if sigma > 0:
+        k = 0.5 * (erf((x + radius + 0.5) / (sigma * np.sqrt(2))) - erf((x - radius - 0.5) / (sigma * np.sqrt(2))))
+    else:
+        k = (np.abs(x) <= radius).astype(np.float64)
+    kernel = np.outer(k, k).astype(np.float32)
+    kernel.flags.writeable = False
+    return kernel
+
+
+#Zeilen- und Spaltenindizes der Fenster um (x, y), periodisch, shape (S, K, 1) und (S, 1, K)
+def splat_indices(x, y, size, Gridsize):
+    offsets = np.arange(size) - size // 2
+    rows = (np.atleast_1d(x)[:, None] + offsets) % Gridsize
+    cols = (np.atleast_1d(y)[:, None] + offsets) % Gridsize
+    return rows[:, :, None], cols[:, None, :]
+
+
+#Pinsel-Abdrücke mit Maximum: field = max(field, amount*kernel), Reihenfolge mehrerer Splats egal
+#x, y (vorletzte, letzte Achse des Feldes) und amount dürfen Arrays sein
+#bei einem Ensemble (..., N, N) wirkt der Pinsel auf alle Mitglieder gleich
+def splat_max(field, x, y, kernel, amount=1.0):
+    rows, cols = splat_indices(x, y, kernel.shape[0], field.shape[-1])
+    amount = np.broadcast_to(np.asarray(amount, dtype=np.float32), (rows.shape[0],))
+    np.maximum.at(field, (Ellipsis, rows, cols), amount[:, None, None] * kernel)
+    return field
+
+
+#Pinsel-Abdrücke, die das Feld weich auf value setzen: field += kernel * (value - field)
+#(für Kräfte mit Vorzeichen, im Kern entspricht das dem bisherigen Setzen des Quadrats)
+#mehrere Splats werden nacheinander angewendet, überlappende Abdrücke ergeben so dasselbe wie einzelne Aufrufe
+#(die Fenster eines Splats wiederholen keine Zelle, da der Kern höchstens N Zellen breit ist)
+def splat_blend(field, x, y, kernel, value):
+    rows, cols = splat_indices(x, y, kernel.shape[0], field.shape[-1])
+    value = np.broadcast_to(np.asarray(value, dtype=np.float32), (rows.shape[0],))
+    for r, c, target in zip(rows, cols, value):
+        window = field[..., r, c]
+        window -= target
+        window *= 1 - kernel
+        window += target
+        field[..., r, c] = window
+    return field
+
+
+#Betrag der Geschwindigkeit |(u, v)|
+def speed(u, v, out=None):
+    return np.hypot(u, v, out=out)
+
+
+#Wirbelstärke ω = ∂v/∂x - ∂u/∂y mit zentralen Differenzen, periodisch, Gitterabstand 1
+#x (Richtung von u) entlang der letzten Achse, y (Richtung von v) entlang der vorletzten
+def vorticity(u, v, out=None):
+    if out is None:
+        out = np.empty_like(u)
+    np.subtract(np.roll(v, -1, axis=-1), np.roll(v, 1, axis=-1), out=out)
+    out -= np.roll(u, -1, axis=-2)
+    out += np.roll(u, 1, axis=-2)
+    out *= 0.5
+    return out
+
+
+#Gemeinsame Semi-Lagrange Advektion: Rückwärtsposition und Interpolationsgewichte werden nur einmal
+#pro Schritt berechnet und dann auf alle Felder (u, v, Dichte) gleichzeitig angewendet
+
+#Rückwärtsposition (Backtracing) der Zellmittelpunkte, in float32, out=(Xb, Yb)
+def departure_points(u_prev, v_prev, coordinates, dt, Gridsize, out=None):
+    if out is None:
+        out = (np.empty(u_prev.shape, dtype=np.float32), np.empty(v_prev.shape, dtype=np.float32))
+    Xb, Yb = out
+    dt = per_member(dt)
+    np.multiply(u_prev, -dt, out=Xb)
+    Xb += coordinates[:, :, 0]
+    np.remainder(Xb, Gridsize, out=Xb)
+    np.multiply(v_prev, -dt, out=Yb)
+    Yb += coordinates[:, :, 1]
+    np.remainder(Yb, Gridsize, out=Yb)
+    return Xb, Yb
+
+
+#leere Arrays für bilinear_stencil: vier flache Indizes (intp) und vier Gewichte (float32)
+def empty_stencil(shape):
+    indices = tuple(np.empty(shape, dtype=np.intp) for _ in range(4))
+    weights = tuple(np.empty(shape, dtype=np.float32) for _ in range(4))
+    return indices, weights
+
+
+#Tabellen für den periodischen Rand, Index k = j0 + 1 in [0, N]:
+#Spalten j0 = (k-1) mod N, j1 = k mod N und Zeilenanfänge j0*N, j1*N (statt Modulo pro Zelle ein np.take)
+@lru_cache(maxsize=16)
+def wrap_tables(N):
+    k = np.arange(N + 1)
+    columns0 = (k - 1) % N
+    columns1 = k % N
+    tables = (columns0, columns1, columns0 * N, columns1 * N)
+    for table in tables:
+        table.flags.writeable = False
+    return tables
+
+
+#Bilinearer Stencil: flache Indizes der vier Nachbarzellen und ihre Gewichte
+#periodischer Rand: Indizes werden über wrap_tables modulo N genommen
+#Xb und Yb werden als Zwischenspeicher benutzt und danach nicht mehr gebraucht
+#Positionen in [0, N] (die Rückwärtspositionen sind schon eingefaltet), auch für beliebige 1D Punktmengen
+def bilinear_stencil(Xb, Yb, Gridsize, out=None):
+    if out is None:
+        out = empty_stencil(Xb.shape)
+    (idx00, idx01, idx10, idx11), (w00, w01, w10, w11) = out
+
+    #Abstand zur linken/oberen Nachbarzelle, Zellmittelpunkte liegen bei i + 0.5
+    #floor(X + 0.5) = j0 + 1 bleibt nicht negativ und ist direkt der Tabellenindex
+    fx, fy = w01, w10
+    np.add(Xb, np.float32(0.5), out=fx)
+    np.floor(fx, out=Xb)
+    fx -= Xb
+    np.add(Yb, np.float32(0.5), out=fy)
+    np.floor(fy, out=Yb)
+    fy -= Yb
+
+    #Gewichte: (1-fx)(1-fy), fx(1-fy), (1-fx)fy, fx*fy
+    np.multiply(fx, fy, out=w11)
+    np.subtract(1, fx, out=w00)
+    w00 -= fy
+    w00 += w11
+    w01 -= w11
+    w10 -= w11
+
+    #Zeilenanfänge i0*N, i1*N und Spalten j0, j1 aus den Tabellen (take darf in sein Indexarray schreiben)
+    columns0, columns1, rows0, rows1 = wrap_tables(Gridsize)
+    np.copyto(idx10, Yb, casting='unsafe')
+    np.take(rows1, idx10, out=idx11, mode='clip')
+    np.take(rows0, idx10, out=idx10, mode='clip')
+    np.copyto(idx00, Xb, casting='unsafe')
+    np.take(columns1, idx00, out=idx01, mode='clip')
+    np.take(columns0, idx00, out=idx00, mode='clip')
+
+    #flache Indizes: 00 = j0 + i0*N, 01 = j1 + i0*N, 10 = j0 + i1*N, 11 = j1 + i1*N
+    #ohne weiteren Puffer über die Differenz der Zeilenanfänge i1*N - i0*N
+    idx00 += idx10
+    idx01 += idx10
+    np.subtract(idx11, idx10, out=idx10)
+    idx10 += idx00
+    np.subtract(idx10, idx00, out=idx11)
+    idx11 += idx01
+
+    #bei einem Stapel (B, N, N) zeigen die Indizes in das flache (B*N*N) Array, Versatz b*N² pro Mitglied
+    if Xb.ndim > 2:
+        members = int(np.prod(Xb.shape[:-2]))
+        offsets = (np.arange(members) * (Gridsize * Gridsize)).reshape(Xb.shape[:-2] + (1, 1))
+        for index in (idx00, idx01, idx10, idx11):
+            index += offsets
+
+    return out
+
+
+#Bilineare Interpolation von einem oder mehreren Feldern (C, N, N) mit einem gemeinsamen Stencil
+#bei einem Ensemble haben die Felder die Form (C, B, N, N) und der Stencil die Form (B, N, N)
+#work ist ein Zwischenspeicher mit der Form des Ergebnisses
+def interpolate_bilinear(fields, stencil, out=None, work=None):
+    indices, weights = stencil
+    flat = fields.reshape(fields.shape[:fields.ndim - indices[0].ndim] + (-1,))
+    axis = flat.ndim - 1
+    if out is None:
+        out = np.empty_like(fields)
+    if work is None:
+        work = np.empty_like(fields)
+
+    #mode='clip': die Indizes sind immer gültig, und nur so schreibt take ohne Puffer direkt nach out
+    np.take(flat, indices[0], axis=axis, out=out, mode='clip')
+    out *= weights[0]
+    for index, weight in zip(indices[1:], weights[1:]):
+        np.take(flat, index, axis=axis, out=work, mode='clip')
+        work *= weight
+        out += work
+    return out
+
+
+#Zeilenblöcke für die parallele Advektion: Liste von (Mitglied, Zeilenbereich), blocks Blöcke pro Mitglied
+#Mitglied ist ein Index-Tupel der Ensemble-Achsen (ohne Ensemble nur ())
+def row_blocks(shape, blocks):
+    bounds = np.linspace(0, shape[-2], blocks + 1).astype(int)
+    return [(member, slice(r0, r1)) for member in np.ndindex(tuple(shape[:-2]))
+            for r0, r1 in zip(bounds[:-1], bounds[1:]) if r1 > r0]
+
+
+#Rückwärtsposition (und bei order=1 Stencil und Interpolation) für einen Zeilenblock eines Mitglieds
+#alle Puffer werden nur im Bereich des Blocks beschrieben, verschiedene Blöcke können also parallel laufen
+#Xb, Yb, stencil, work und out haben die Form wie im Simulationsschritt, fields ist (C, ..., N, N)
+def advect_block(fields, u_prev, v_prev, coordinates, dt, Gridsize, member, rows, out, Xb, Yb, stencil, work, order=1):
+    block = member + (rows,)
+    if np.ndim(dt) > 0:
+        dt = np.asarray(dt)[member]
+    departure_points(u_prev[block], v_prev[block], coordinates[rows], dt, Gridsize, out=(Xb[block], Yb[block]))
+    if order != 1:
+        return
+
+    #Stencil des Blocks ohne Ensemble-Versatz, interpoliert wird im Feld des Mitglieds
+    indices, weights = stencil
+    block_stencil = ([index[block] for index in indices], [weight[block] for weight in weights])
+    bilinear_stencil(Xb[block], Yb[block], Gridsize, out=block_stencil)
+    for c in range(fields.shape[0]):
+        interpolate_bilinear(fields[c][member], block_stencil, out=out[c][block], work=work[c][block])
+
+
+#Advektion eines Stapels von Feldern (C, N, N) bzw. (C, B, N, N) entlang von (u_prev, v_prev) in einem Durchgang
+#order=1: bilinearer schneller Pfad, order>1: Spline-Interpolation von scipy mit gemeinsamen Koordinaten
+#die Kanäle ab clip_from (Dichte, Farbstoffe) werden nach der Spline-Interpolation auf >= 0 begrenzt, None = keine
+#(die bilineare Interpolation mittelt nur und kann keine negativen Werte erzeugen)
+#Arbeitspuffer, sonst neu angelegt: points=(Xb, Yb) und stencil in der Form eines Feldes, work in der Form von fields
+#run(fn, items): führt fn für alle items aus (z.B. FluidSimulation.parallel auf dem Thread-Pool), dann laufen
+#Rückwärtsposition und bilineare Interpolation in den Zeilenblöcken blocks (row_blocks) und die Splines pro Feld parallel
+def advect_fields(fields, u_prev, v_prev, coordinates, dt, Gridsize, order=1, out=None, clip_from=2,
+                  points=None, stencil=None, work=None, run=None, blocks=None):
+    if out is None:
+        out = np.empty_like(fields)
+    if points is None:
+        points = (np.empty(u_prev.shape, dtype=np.float32), np.empty(v_prev.shape, dtype=np.float32))
+    Xb, Yb = points
+
+    if run is None:
+        departure_points(u_prev, v_prev, coordinates, dt, Gridsize, out=points)
+        if order == 1:
+            return interpolate_bilinear(fields, bilinear_stencil(Xb, Yb, Gridsize, out=stencil), out=out, work=work)
+    else:
+        #jeder Zeilenblock schreibt nur in seine Zeilen der Puffer
+        if stencil is None:
+            stencil = empty_stencil(u_prev.shape)
+        if work is None:
+            work = np.empty_like(fields)
+        if blocks is None:
+            blocks = row_blocks(u_prev.shape, 1)
+        run(lambda block: advect_block(fields, u_prev, v_prev, coordinates, dt, Gridsize, *block,
+                                       out, Xb, Yb, stencil, work, order), blocks)
+        if order == 1:
+            return out
+
+    Xb -= np.float32(0.5)
+    Yb -= np.float32(0.5)
+
+    #einmal pro Feld und Ensemble-Mitglied (ohne Ensemble nur ()), mode='grid-wrap' ist die echte periodische Fortsetzung
+    def spline(item):
+        c, b = item
+        map_coordinates(fields[c][b], [Yb[b], Xb[b]], output=out[c][b], order=order, mode='grid-wrap')
+
+    items = [(c, b) for c in range(fields.shape[0]) for b in np.ndindex(Xb.shape[:-2])]
+    if run is None:
+        for item in items:
+            spline(item)
+    else:
+        run(spline, items)
+    if clip_from is not None:
+        np.clip(out[clip_from:], 0.0, None, out=out[clip_from:])    #Spline kann negative Dichte erzeugen
+    return out
+
+
 #Lösen der Diffusionsgleichung im Frequenzraum
-def diffuse(field, viscosity, dt, K_sq):
+def diffuse(field, viscosity, dt, K_sq, out=None):
     field_hat = np.fft.fft2(field)
     # Die Lösung im Frequenzraum entspricht: u_hat / (1 + ν*dt*k²)
-    diffused = np.real(np.fft.ifft2(field_hat / (1 + viscosity * dt * K_sq)))
-    return diffused
+    field_hat /= (1 + viscosity * dt * K_sq)
+    diffused = np.fft.ifft2(field_hat, out=field_hat).real
+    if out is None:
+        return diffused.astype(field.dtype)
+    out[...] = diffused
+    return out
 
 
 #Projiziert das Geschwindigkeitsfeld auf ein divergenzfreies Feld.
 #Dies ist notwendig, um die Inkompressibilitätsbedingung zu erfüllen (Divergenzfreiheit).
 #Wird im Frequenzraum glöst, da sich die Gleichung dort sehr stark vereinfacht
-def project(u, v, KX, KY, K_sq):
+#out=(u_out, v_out)
+def project(u, v, KX, KY, K_sq, out=None):
 
     u_hat = np.fft.fft2(u)
     v_hat = np.fft.fft2(v)
@@ -76,4 +370,192 @@ def project(u, v, KX, KY, K_sq):
     u_hat -= 1j * KX * p_hat
     v_hat -= 1j * KY * p_hat
 
-    return np.real(np.fft.ifft2(u_hat)), np.real(np.fft.ifft2(v_hat))
+    if out is None:
+        out = (np.empty_like(u), np.empty_like(v))
+    out[0][...] = np.fft.ifft2(u_hat, out=u_hat).real
+    out[1][...] = np.fft.ifft2(v_hat, out=v_hat).real
+    return out
+
+
+#Spektraler Löser mit reeller FFT (rfft2): die Felder sind reell, daher reicht die halbe Frequenzebene.
+#Präzision: float32 Felder <-> complex64 Spektren, numpy rechnet die FFT dann direkt in einfacher Genauigkeit
+
+#Normierung 'ortho' für Hin- und Rücktransformation: das Produkt ist wie bei der Standardnormierung 1/N²,
+#aber numpy bekommt einen float32 Faktor und muss mit out= kein Zwischenarray anlegen
+FFT_NORM = 'ortho'
+
+#workers > 1: Transformationen über scipy.fft mit mehreren Threads (kein out=, das Ergebnis wird kopiert)
+#workers = 1: numpy ohne Zwischenarrays
+
+
+#rfft2 über die letzten beiden Achsen nach out
+def rfft2_into(field, out=None, workers=1):
+    if workers == 1:
+        return np.fft.rfft2(field, out=out, norm=FFT_NORM)
+    field_hat = scipy_fft.rfft2(field, norm=FFT_NORM, workers=workers)
+    if out is None:
+        return field_hat
+    np.copyto(out, field_hat)
+    return out
+
+#Gittergeometrie einer Gittergröße: Zellmittelpunkte X, Y, coordinates (N, N, 2) float32
+#und die vollen Wellenzahlgitter KX, KY, K_sq für diffuse/project
+#gecached (begrenzt), damit ein Wechsel zwischen Auflösungen nichts neu aufbauen muss
+@lru_cache(maxsize=8)
+def grid_geometry(N):
+    x = (np.arange(N) + 0.5)
+    y = (np.arange(N) + 0.5)
+    X, Y = np.meshgrid(x, y, indexing='xy')
+    coordinates = np.dstack((X, Y)).astype(np.float32)      # 3D-Array mit X,Y-Koordinaten
+
+    kx = 2 * np.pi * np.fft.fftfreq(N)        #Wellenzahlen
+    ky = 2 * np.pi * np.fft.fftfreq(N)
+    KX, KY = np.meshgrid(kx, ky, indexing='xy')
+    K_sq = (KX**2 + KY**2).astype(np.float32)    #k² berechnen
+    K_sq[0, 0] = 1     #teilen durch 0 verhindern
+    for array in (X, Y, coordinates, KX, KY, K_sq):
+        array.flags.writeable = False
+    return X, Y, coordinates, KX, KY, K_sq
+
+
+#Wellenzahlen auf dem halben rfft2-Gitter, shape (N, N//2+1), x entlang der letzten Achse
+@lru_cache(maxsize=16)
+def rfft_wavenumbers(N):
+    kx = (2 * np.pi * np.fft.fftfreq(N)[:N // 2 + 1]).astype(np.float32)     #wie fftfreq, Nyquist negativ
+    ky = (2 * np.pi * np.fft.fftfreq(N)).astype(np.float32)
+    KX, KY = np.meshgrid(kx, ky, indexing='xy')
+    K_sq = KX**2 + KY**2
+    K_sq[0, 0] = 1     #teilen durch 0 verhindern
+    for array in (KX, KY, K_sq):
+        array.flags.writeable = False       #gecachte Arrays schützen
+    return KX, KY, K_sq
+
+
+#Schalen für das isotrope Spektrum E(k) auf dem halben rfft2-Gitter: ganzzahliger Betrag |k| in Einheiten von 2π/N
+#und das Gewicht jeder Spalte (die Spalten 1..N/2-1 stehen auch für ihre konjugierten Partner, zählen also doppelt)
+#gibt (Schale (N, N//2+1) intp, Gewicht (N, N//2+1) float32, Anzahl Schalen) zurück
+@lru_cache(maxsize=8)
+def spectrum_shells(N):
+    KX, KY, _ = rfft_wavenumbers(N)
+    shell = np.rint(np.hypot(KX, KY) * N / (2 * np.pi)).astype(np.intp)
+    weight = np.full(KX.shape, 2, dtype=np.float32)
+    weight[:, 0] = 1
+    if N % 2 == 0:
+        weight[:, -1] = 1
+    for array in (shell, weight):
+        array.flags.writeable = False
+    return shell, weight, int(shell.max()) + 1
+
+
+#Diffusionsoperator 1/(1+ν*dt*k²), gecached pro (N, dt, visc)
+#dt und visc als Tupel (siehe parameter_key) ergeben einen Operator der Form (B, N, N//2+1)
+@lru_cache(maxsize=32)
+def diffusion_operator(N, dt, visc):
+    _, _, K_sq = rfft_wavenumbers(N)
+    nu_dt = np.multiply(visc, dt, dtype=np.float32)
+    operator = (1 / (1 + per_member(nu_dt) * K_sq)).astype(np.float32)
+    operator.flags.writeable = False
+    return operator
+
+
+#Diffusion und Projektion zusammengefasst: P = (I - k kᵀ/k²) / (1+ν*dt*k²)
+#gibt die drei Einträge der symmetrischen 2x2 Matrix zurück, gecached pro (N, dt, visc)
+@lru_cache(maxsize=32)
+def projection_operator(N, dt, visc):
+    KX, KY, K_sq = rfft_wavenumbers(N)
+    D = diffusion_operator(N, dt, visc)
+    P_xx = (1 - KX * KX / K_sq) * D
+    P_xy = -(KX * KY / K_sq) * D
+    P_yy = (1 - KY * KY / K_sq) * D
+    #beim mittelwert (k=0) gilt KX=KY=0, also P = I, wie bei project()
+    #in der Nyquist-Zeile (ky = -π) mittelt der Realteil in project() die Terme von ±kx,
+    #der gemischte Term fällt dort weg (außer in der Ecke, die auf sich selbst abgebildet wird)
+    if N % 2 == 0:
+        P_xy[..., N // 2, :-1] = 0
+    for array in (P_xx, P_xy, P_yy):
+        array.flags.writeable = False
+    return P_xx, P_xy, P_yy
+
+
+#Inverse rfft2 mit Ziel out, ohne komplexes Zwischenarray
+#die inverse FFT entlang der Zeilenachse läuft direkt in field_hat, field_hat wird also überschrieben
+def irfft2_into(field_hat, out, workers=1):
+    if workers > 1:
+        np.copyto(out, scipy_fft.irfft2(field_hat, s=out.shape[-2:], norm=FFT_NORM, overwrite_x=True, workers=workers))
+        return out
+    np.fft.ifft(field_hat, axis=-2, out=field_hat, norm=FFT_NORM)
+    return np.fft.irfft(field_hat, n=out.shape[-1], axis=-1, out=out, norm=FFT_NORM)
+
+
+#Felder (..., M, M) spektral auf ein Gitter der Größe N umrechnen: Fourier-Abschneiden (N < M)
+#bzw. Auffüllen mit Nullen (N > M). Die Moden bis (min(M, N)-1)//2 bleiben erhalten, die Nyquist-Mode fällt weg.
+#Die Werte liegen in den Zellmittelpunkten (i + 0.5) * L/M, die FFT bezieht sich aber auf i * L/M: jede Mode k bekommt
+#daher den Phasenfaktor exp(iπk(1/N - 1/M)) je Achse, sonst verschiebt jede Umrechnung das Feld um eine halbe Zelle.
+#So bleiben Mittelwert, Amplituden und Lage der aufgelösten Moden erhalten, Ergebnis float32 (..., N, N)
+def resample_spectral(field, N, out=None):
+    M = field.shape[-1]
+    if out is None:
+        out = np.empty(field.shape[:-2] + (N, N), dtype=np.float32)
+    field_hat = np.fft.rfft2(np.asarray(field, dtype=np.float32), norm=FFT_NORM)
+
+    k = (min(M, N) - 1) // 2
+    resampled = np.zeros(field.shape[:-2] + (N, N // 2 + 1), dtype=np.complex64)
+    resampled[..., :k + 1, :k + 1] = field_hat[..., :k + 1, :k + 1]
+    if k > 0:
+        resampled[..., -k:, :k + 1] = field_hat[..., -k:, :k + 1]
+
+    #Verschiebung der Zellmittelpunkte, Wellenzahlen mit Vorzeichen (Zeilen) bzw. 0..N/2 (Spalten)
+    shift = np.pi * (1 / N - 1 / M)
+    rows = np.exp(1j * shift * np.fft.fftfreq(N, 1 / N)).astype(np.complex64)
+    columns = np.exp(1j * shift * np.arange(N // 2 + 1)).astype(np.complex64)
+    resampled *= rows[:, None] * columns[None, :]
+    resampled *= N / M          #bei norm='ortho' skalieren die Koeffizienten mit der Gittergröße
+    return irfft2_into(resampled, out)
+
+
+#leere Spektren für diffuse_spectral/diffuse_project, shape (count, ..., N, N//2+1), complex64
+#die FFTs laufen immer über die letzten beiden Achsen, ein Ensemble wird also in einem Aufruf transformiert
+def empty_spectra(shape, count=4):
+    return np.empty((count,) + tuple(shape[:-1]) + (shape[-1] // 2 + 1,), dtype=np.complex64)
+
+
+#Diffusion eines skalaren Feldes mit einer rfft2 hin und zurück
+#work: ein komplexes Spektrum (..., N, N//2+1) als Zwischenspeicher, out darf field sein
+def diffuse_spectral(field, viscosity, dt, out=None, work=None, workers=1):
+    N = field.shape[-1]
+    if out is None:
+        out = np.empty_like(field)
+    field_hat = rfft2_into(field, work, workers)
+    field_hat *= diffusion_operator(N, parameter_key(dt), parameter_key(viscosity))
+    return irfft2_into(field_hat, out, workers)
+
+
+#Diffusion und Projektion des Geschwindigkeitsfeldes in einem Durchgang im Frequenzraum
+#ersetzt diffuse(u), diffuse(v) und project(u, v): 2 statt 6 Hin- und Rücktransformationen
+#out=(u_out, v_out), work: Spektren aus empty_spectra(u.shape)
+#diagnostics: optional SpectralDiagnostics, bekommt die projizierten Spektren vor der Rücktransformation
+def diffuse_project(u, v, viscosity, dt, out=None, work=None, workers=1, diagnostics=None):
+    N = u.shape[-1]
+    P_xx, P_xy, P_yy = projection_operator(N, parameter_key(dt), parameter_key(viscosity))
+    if out is None:
+        out = (np.empty_like(u), np.empty_like(v))
+    if work is None:
+        work = empty_spectra(u.shape)
+    u_hat, v_hat, uv_hat, vu_hat = work
+
+    rfft2_into(u, u_hat, workers)
+    rfft2_into(v, v_hat, workers)
+
+    #u_neu = P_xx*u + P_xy*v,  v_neu = P_xy*u + P_yy*v
+    np.multiply(P_xy, v_hat, out=uv_hat)
+    np.multiply(P_xy, u_hat, out=vu_hat)
+    u_hat *= P_xx
+    u_hat += uv_hat
+    v_hat *= P_yy
+    v_hat += vu_hat
+
+    if diagnostics is not None:
+        diagnostics.velocity(u_hat, v_hat, work=(uv_hat, vu_hat))
+    irfft2_into(u_hat, out[0], workers)
+    irfft2_into(v_hat, out[1], workers)
+    return out
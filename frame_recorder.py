@@ -0,0 +1,318 @@
+#Aufnahme der dargestellten Frames als animiertes GIF oder PNG-Folge, ohne den Render-Loop auszubremsen
+#Die Frames liegen in Shared Memory (slots Puffer mit gepackten 32 Bit Pixeln, Byte-Reihenfolge R, G, B, X).
+#Der Renderer schreibt direkt in einen freien Puffer (render_packed(..., out=frame, shifts=SHIFTS), in main.py
+#über pygame.image.frombuffer als Surface), mehrere Kodierprozesse reduzieren die Farben auf eine Palette und
+#kodieren parallel, ein Schreibprozess bringt die Frames wieder in ihre Reihenfolge.
+#Auf der Seite der Simulation wird nichts kopiert; ist kein Puffer frei, wird der Frame ausgelassen. Die Anzeigedauer
+#jedes GIF-Frames kommt aus dem Zeitstempel der Aufnahme, die Wiedergabe läuft also auch dann in Echtzeit.
+#GIF und PNG werden ohne weitere Abhängigkeiten selbst geschrieben (LZW bzw. zlib).
+#
+#Beispiel (headless):
+#   recorder = FrameRecorder("fluid.gif", fps=30)
+#   acquired = recorder.acquire(N, N)
+#   if acquired is not None:
+#       slot, frame = acquired
+#       renderer.render_packed(fluid.density, frame, SHIFTS)
+#       recorder.submit(slot, N, N)             #ohne timestamp im Abstand 1/fps
+#   recorder.close()
+
+import multiprocessing
+import os
+import queue
+import struct
+import zlib
+from multiprocessing import shared_memory
+import numpy as np
+
+
+SHIFTS = (0, 8, 16)                         # Bitpositionen von Rot, Grün, Blau ("RGBX" in pygame.image.frombuffer)
+MASKS = (0xff, 0xff00, 0xff0000, 0)         # passende Masken für pygame.Surface, damit transform.scale nicht umrechnet
+
+
+#Frame (H, W) uint32 auf höchstens 256 Farben reduzieren, gibt (Palette (P, 3) uint8, Indizes (H, W) uint8) zurück
+#bis 256 verschiedene Farben (z.B. Farbtabellen der DensityRenderer) exakt, sonst Popularitätsverfahren:
+#Farben auf 5 Bit pro Kanal einsortieren, die 256 häufigsten Klassen bilden die Palette (Mittelwert der Farben),
+#jede übrige Klasse bekommt den nächsten Paletteneintrag
+def quantise(frame, shifts=SHIFTS):
+    rgb = np.stack([(frame >> shift) & 0xff for shift in shifts], axis=-1).astype(np.int32)
+    colours = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+    unique, inverse = np.unique(colours, return_inverse=True)
+    if len(unique) <= 256:
+        palette = np.stack([unique >> 16, (unique >> 8) & 0xff, unique & 0xff], axis=-1).astype(np.uint8)
+        return palette, inverse.reshape(frame.shape).astype(np.uint8)
+
+    bins = ((rgb[..., 0] >> 3) << 10) | ((rgb[..., 1] >> 3) << 5) | (rgb[..., 2] >> 3)
+    bins = bins.reshape(-1)
+    counts = np.bincount(bins, minlength=1 << 15)
+    used = np.flatnonzero(counts)
+    popular = used[np.argsort(counts[used])[::-1][:256]]
+    palette = np.stack([np.bincount(bins, rgb.reshape(-1, 3)[:, c], minlength=1 << 15)[popular] / counts[popular]
+                        for c in range(3)], axis=-1)
+    centres = np.stack([used >> 10, (used >> 5) & 31, used & 31], axis=-1) * 8 + 4
+    distance = ((centres[:, None, :] - palette[None, :, :]) ** 2).sum(axis=-1)
+    mapping = np.zeros(1 << 15, dtype=np.uint8)
+    mapping[used] = np.argmin(distance, axis=1)
+    return np.round(palette).astype(np.uint8), mapping[bins].reshape(frame.shape)
+
+
+#LZW Kompression der Palettenindizes für GIF (variable Codelänge bis 12 Bit, Clear-Code bei voller Tabelle)
+#die Schleife in Python sammelt nur die Codes und die Stellen, an denen sich die Codelänge ändert,
+#das Packen der Bits (der größere Teil der Arbeit bei schlecht komprimierbaren Frames) läuft danach in numpy
+def lzw_encode(indices, code_size=8):
+    clear = 1 << code_size
+    end = clear + 1
+    data = indices.tobytes()
+    codes = [clear]                         #Datenstrom beginnt mit dem Clear-Code
+    changes = [(0, code_size + 1)]          #(erster Code, Codelänge ab dort)
+    table = {}
+    lookup = table.get
+    emit = codes.append
+    next_code = end + 1
+    limit = 1 << (code_size + 1)
+
+    prefix = data[0]
+    for byte in data[1:]:
+        key = prefix << 8 | byte
+        code = lookup(key)
+        if code is not None:
+            prefix = code
+            continue
+        emit(prefix)
+        if next_code == 4096:
+            #Tabelle voll: Clear-Code (noch mit 12 Bit) senden und von vorne beginnen
+            emit(clear)
+            table.clear()
+            next_code = end + 1
+            limit = 1 << (code_size + 1)
+            changes.append((len(codes), code_size + 1))
+        else:
+            if next_code >= limit:
+                limit <<= 1
+                changes.append((len(codes), limit.bit_length() - 1))
+            table[key] = next_code
+            next_code += 1
+        prefix = byte
+    codes += (prefix, end)
+
+    #Codes LSB zuerst aneinanderhängen: jeder Code (höchstens 12 Bit + 7 Bit Versatz) berührt höchstens 3 Bytes,
+    #die Bits verschiedener Codes überlappen nicht, daher kann pro Byte einfach summiert werden
+    starts = [start for start, _ in changes] + [len(codes)]
+    widths = np.repeat([width for _, width in changes], np.diff(starts))
+    codes = np.array(codes, dtype=np.int64)
+    offsets = np.cumsum(widths) - widths
+    shifted = codes << (offsets & 7)
+    position = offsets >> 3
+    size = (int(offsets[-1] + widths[-1]) + 7) // 8
+    packed = np.bincount(np.concatenate((position, position + 1, position + 2)),
+                         weights=np.concatenate((shifted & 0xff, (shifted >> 8) & 0xff, shifted >> 16)),
+                         minlength=size + 2)
+    return packed[:size].astype(np.uint8).tobytes()
+
+
+#Animiertes GIF, Frames werden einzeln angehängt, damit nie die ganze Aufnahme im Speicher liegt
+class GifWriter:
+
+    def __init__(self, path, width, height):
+        self.file = open(path, "wb")
+        self.file.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0, 0, 0))
+        self.file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")      #Endlosschleife
+
+    #kodierten Frame (gif_image) mit der Anzeigedauer delay in Hundertstelsekunden anhängen
+    def write(self, image, delay):
+        self.file.write(b"\x21\xf9\x04\x00" + struct.pack("<H", delay) + b"\x00\x00")
+        self.file.write(image)
+
+    def close(self):
+        self.file.write(b"\x3b")
+        self.file.close()
+
+
+#Bildblock eines GIF-Frames (Bildbeschreibung, lokale Farbtabelle, LZW-Daten) aus den Palettenindizes
+def gif_image(palette, indices):
+    height, width = indices.shape
+    table = np.zeros((256, 3), dtype=np.uint8)      #lokale Farbtabelle mit 256 Einträgen
+    table[:len(palette)] = palette
+    data = lzw_encode(indices)
+    blocks = [b"\x2c" + struct.pack("<HHHHB", 0, 0, width, height, 0x87), table.tobytes(), b"\x08"]
+    for start in range(0, len(data), 255):          #Datenblöcke mit höchstens 255 Bytes
+        block = data[start:start + 255]
+        blocks.append(bytes([len(block)]) + block)
+    blocks.append(b"\x00")
+    return b"".join(blocks)
+
+
+#PNG mit Palette (Farbtyp 3) aus den Palettenindizes
+def png_image(palette, indices):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    height, width = indices.shape
+    rows = np.zeros((height, width + 1), dtype=np.uint8)      #Filterbyte 0 vor jeder Zeile
+    rows[:, 1:] = indices
+    return b"".join((b"\x89PNG\r\n\x1a\n",
+                     chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)),
+                     chunk(b"PLTE", palette.tobytes()),
+                     chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)),
+                     chunk(b"IEND", b"")))
+
+
+def write_png(path, palette, indices):
+    with open(path, "wb") as f:
+        f.write(png_image(palette, indices))
+
+
+#Kodierprozess (mehrere parallel): wartet auf (Index, slot, width, height, Zielgröße, Zeit), quantisiert den Frame,
+#gibt den Puffer zurück und reicht den kodierten Frame an den Schreibprozess weiter
+#Frames mit anderer Größe (Auflösung geändert) werden auf die Zielgröße (die des ersten Frames) skaliert (nächster Nachbar)
+def encode_frames(name, slot_size, pending, free, results, format):
+    memory = shared_memory.SharedMemory(name=name)
+    frames = np.ndarray((len(memory.buf) // (4 * slot_size), slot_size), dtype=np.uint32, buffer=memory.buf)
+    try:
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            index, slot, width, height, size, timestamp = item
+            frame = frames[slot, :width * height].reshape(height, width)
+            if (width, height) != size:
+                rows = np.arange(size[1]) * height // size[1]
+                columns = np.arange(size[0]) * width // size[0]
+                frame = frame[rows[:, None], columns[None, :]]
+            palette, indices = quantise(frame)
+            del frame
+            free.put(slot)                  #Puffer ist gelesen, der Renderer kann ihn wieder füllen
+            image = gif_image(palette, indices) if format == "gif" else png_image(palette, indices)
+            results.put((index, size, timestamp, image))
+    finally:
+        results.put(None)
+        del frames
+        memory.close()
+
+
+#Schreibprozess: bringt die Frames der Kodierprozesse wieder in die Reihenfolge der Aufnahme und schreibt sie
+#die Anzeigedauer jedes GIF-Frames folgt aus dem Zeitpunkt des nächsten Frames (auf Hundertstel aufsummiert, damit
+#sich Rundungen nicht addieren), ausgelassene Frames verlängern also den vorherigen statt die Wiedergabe zu raffen
+def write_frames(results, encoders, path, format, fps):
+    waiting = {}                            # Index -> (Größe, Zeit, Bild), noch nicht an der Reihe
+    next_index = 0
+    held = None                             # letzter GIF-Frame, wartet auf den Zeitpunkt des nächsten
+    writer = None
+    written = 0                             # geschriebene Anzeigedauer in Hundertstelsekunden
+    finished = 0
+    try:
+        while finished < encoders:
+            item = results.get()
+            if item is None:
+                finished += 1
+                continue
+            waiting[item[0]] = item[1:]
+            while next_index in waiting:
+                size, timestamp, image = waiting.pop(next_index)
+                if format != "gif":
+                    if next_index == 0:
+                        os.makedirs(path, exist_ok=True)
+                    with open(os.path.join(path, f"frame_{next_index:05d}.png"), "wb") as f:
+                        f.write(image)
+                else:
+                    if writer is None:
+                        writer = GifWriter(path, *size)
+                        start = timestamp
+                    if held is not None:
+                        delay = max(2, round(100 * (timestamp - start)) - written)      #unter 2/100 s zeigen Browser 1/10 s
+                        writer.write(held, delay)
+                        written += delay
+                    held = image
+                next_index += 1
+    finally:
+        if held is not None:
+            writer.write(held, max(2, round(100 / fps)))
+        if writer is not None:
+            writer.close()
+
+
+class FrameRecorder:
+
+    #path: .gif Datei oder Verzeichnis für die PNG-Folge, every: nur jeden every-ten angebotenen Frame aufnehmen
+    #max_size: größte Framegröße (width, height), slots: Anzahl der Puffer im Shared Memory
+    #encoders: Anzahl der Kodierprozesse (die LZW-Kodierung eines 500x500 Frames dauert etwa 150 ms)
+    #fps: Bildrate für Frames ohne Zeitstempel (submit ohne timestamp, z.B. headless ein Frame je every Schritte)
+    def __init__(self, path, fps=30, every=1, slots=None, max_size=(500, 500), format=None, encoders=None):
+        self.path = path
+        self.format = format or ("gif" if path.lower().endswith(".gif") else "png")
+        self.fps = fps
+        self.every = every
+        self.slot_size = max_size[0] * max_size[1]
+        self.encoders = encoders or max(1, min(4, (os.cpu_count() or 2) // 2))
+        slots = slots or 2 * self.encoders
+        self.size = None                    # Größe des ersten Frames, alle weiteren werden darauf skaliert
+        self.offered = 0                    # angebotene Frames (acquire)
+        self.recorded = 0                   # an die Kodierprozesse übergebene Frames
+        self.dropped = 0                    # ausgelassene Frames (kein freier Puffer)
+
+        self.memory = shared_memory.SharedMemory(create=True, size=4 * slots * self.slot_size)
+        self.frames = np.ndarray((slots, self.slot_size), dtype=np.uint32, buffer=self.memory.buf)
+
+        #spawn statt fork, damit die Prozesse nichts vom pygame Zustand erben
+        context = multiprocessing.get_context("spawn")
+        self.pending = context.Queue()
+        self.free = context.Queue()
+        self.results = context.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.processes = [context.Process(target=encode_frames, name=f"frame-encoder-{i}", daemon=True,
+                                          args=(self.memory.name, self.slot_size, self.pending, self.free,
+                                                self.results, self.format))
+                          for i in range(self.encoders)]
+        self.processes.append(context.Process(target=write_frames, name="frame-writer", daemon=True,
+                                              args=(self.results, self.encoders, path, self.format, fps)))
+        for process in self.processes:
+            process.start()
+
+    #freien Puffer für einen Frame der Größe (width, height) holen
+    #mit wait=True wird gewartet, bis ein Kodierprozess einen Puffer freigibt: kein Frame fehlt, aber der Aufrufer
+    #(headless der Löser) läuft dann nur so schnell, wie kodiert wird. Ohne wait wird der Frame stattdessen ausgelassen
+    #gibt (slot, frame) zurück, frame ist ein uint32 View (width, height) wie pygame.surfarray.pixels2d,
+    #oder None, wenn dieser Frame nicht aufgenommen wird
+    def acquire(self, width, height, wait=False):
+        if width * height > self.slot_size:
+            raise ValueError(f"frame {width}x{height} does not fit into the recorder slots")
+        self.offered += 1
+        if (self.offered - 1) % self.every:
+            return None
+        try:
+            slot = self.free.get() if wait else self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return None
+        return slot, self.frames[slot, :width * height].reshape(height, width).T
+
+    #zusammenhängender Puffer eines slots, z.B. für pygame.image.frombuffer(buffer, (width, height), "RGBX")
+    def buffer(self, slot, width, height):
+        return self.frames[slot, :width * height]
+
+    #fertig gezeichneten Frame an die Kodierprozesse übergeben
+    #timestamp: Zeitpunkt des Frames in Sekunden (z.B. time.perf_counter()), bestimmt die Anzeigedauer im GIF,
+    #ohne timestamp folgen die Frames im Abstand 1/fps
+    def submit(self, slot, width, height, timestamp=None):
+        if self.size is None:
+            self.size = (width, height)
+        if timestamp is None:
+            timestamp = self.recorded / self.fps
+        self.pending.put((self.recorded, slot, width, height, self.size, timestamp))
+        self.recorded += 1
+
+    #Aufnahme beenden, wartet bis alle Frames kodiert und geschrieben sind
+    def close(self):
+        if self.processes is None:
+            return
+        for _ in range(self.encoders):
+            self.pending.put(None)
+        for process in self.processes:
+            process.join()
+        self.processes = None
+        self.frames = None
+        try:
+            self.memory.close()
+        except BufferError:                 #es gibt noch Views (z.B. Surfaces aus frombuffer), nur freigeben
+            pass
+        self.memory.unlink()
@@ -0,0 +1,233 @@
+#Headless Ausführung der Fluid Simulation ohne Fenster (kein pygame/pygame_widgets Import)
+#Läuft so schnell wie möglich und gibt die Schritte pro Sekunde aus
+#
+#Beispiel:
+#   python headless.py --N 256 --steps 500 --dt 0.3 --visc 0.001 --schedule schedule.json
+#
+#Ein Schedule ist eine JSON Liste von Ereignissen, Koordinaten in Zellen wie in main.py (x = erste Achse):
+#   [{"step": 0, "repeat": 50, "kind": "density", "x": 128, "y": 128, "radius": 8, "amount": 1.0},
+#    {"step": 0, "repeat": 20, "kind": "force", "x": 128, "y": 128, "radius": 4, "dx": 5, "dy": 0}]
+#"kind": "dye" bringt Farbstoff "channel" ein (benötigt --dyes)
+#"kind": "particles" erzeugt "count" Tracer-Teilchen mit Streuung "spread" (benötigt --particles)
+#"repeat" gibt an, in wie vielen aufeinanderfolgenden Schritten das Ereignis ausgeführt wird (Standard 1)
+#
+#Mit --record run1 --record-every 10 wird jeder 10. Schritt nach run1/ aufgezeichnet (siehe recorder.py),
+#mit --restart run1 --restart-step 2000 startet die Simulation vom Frame dieses Schritts, Schedule und neue Aufzeichnung
+#zählen die Schritte von dort an weiter (Ereignisse vor dem Checkpoint werden nicht noch einmal ausgeführt)
+#Mit --diagnostics diag.npz werden Energie, E(k), Enstrophie, Divergenz und Masse jedes Schritts gesammelt (diagnostics.py)
+#Mit --frames fluid.gif --frames-every 5 wird jeder 5. Schritt als Bild der Dichte aufgenommen (siehe frame_recorder.py)
+
+import argparse
+import json
+import time
+import numpy as np
+from fluid_class import FluidSimulation
+from recorder import StateRecorder, restore
+from frame_recorder import FrameRecorder, SHIFTS
+from rendering import DensityRenderer, COLORMAPS
+from diagnostics import SpectralDiagnostics
+
+
+#Dichte mit dem Pinsel um (x, y) einbringen, wie bei der linken Maustaste in main.py
+def inject_density(fluid, x, y, radius, amount=1.0):
+    fluid.splat_density(x, y, radius, amount)
+
+
+#Farbstoff channel mit dem Pinsel um (x, y) einbringen
+def inject_dye(fluid, channel, x, y, radius, amount=1.0):
+    fluid.splat_dye(channel, x, y, radius, amount)
+
+
+#count Tracer-Teilchen gaußverteilt (spread Zellen) um (x, y) erzeugen, benötigt fluid.add_particles
+def emit_particles(fluid, x, y, count, spread=0.0):
+    fluid.emit_particles(x, y, count, spread)
+
+
+#Kraft mit dem Pinsel um (x, y) setzen, wie bei der rechten Maustaste in main.py
+#dx, dy ist die Bewegungsrichtung in Zellen, die Stärke wird mit der Länge der Bewegung skaliert
+def inject_force(fluid, x, y, radius, dx, dy, speed=1.0):
+    speed_factor = np.sqrt(dx**2 + dy**2) * 0.001
+    force_radius = max(1, radius // 2)              #kleinerer Radius für die kraft
+    fluid.splat_force(x, y, force_radius, dy * speed_factor * speed, dx * speed_factor * speed)
+
+
+#Zeitschritt und Viskosität setzen, wie die Slider in main.py
+def set_parameters(fluid, dt, visc):
+    fluid.dt = dt
+    fluid.visc = visc
+
+
+#Standard Schedule: Dichtequelle in der Mitte und ein Kraftstoß nach rechts
+def default_schedule(N):
+    c = N // 2
+    radius = max(1, int(N * 35 / 1000))
+    return [
+        {"step": 0, "repeat": 100, "kind": "density", "x": c, "y": c, "radius": radius, "amount": 1.0},
+        {"step": 0, "repeat": 30, "kind": "force", "x": c, "y": c, "radius": radius, "dx": 10, "dy": 3},
+    ]
+
+
+#Ereignisse, die im Schritt step aktiv sind, auf die Simulation anwenden
+def apply_schedule(fluid, schedule, step):
+    for event in schedule:
+        start = event.get("step", 0)
+        if not start <= step < start + event.get("repeat", 1):
+            continue
+        if event["kind"] == "density":
+            inject_density(fluid, event["x"], event["y"], event["radius"], event.get("amount", 1.0))
+        elif event["kind"] == "dye":
+            inject_dye(fluid, event["channel"], event["x"], event["y"], event["radius"], event.get("amount", 1.0))
+        elif event["kind"] == "particles":
+            emit_particles(fluid, event["x"], event["y"], event["count"], event.get("spread", 0.0))
+        elif event["kind"] == "force":
+            inject_force(fluid, event["x"], event["y"], event["radius"],
+                         event["dx"], event["dy"], event.get("speed", 1.0))
+        else:
+            raise ValueError(f"unknown event kind: {event['kind']!r}")
+
+
+#Dichtefeld wie visualisation() in main.py direkt in einen freien Puffer des FrameRecorder zeichnen
+#ohne Fenster wird auf einen freien Puffer gewartet, damit kein Frame fehlt: sind die Kodierprozesse langsamer als der
+#Löser, bremsen sie ihn (--frames-every vergrößern, wenn die Schritte pro Sekunde zählen)
+def record_frame(recorder, renderer, fluid):
+    acquired = recorder.acquire(fluid.N, fluid.N, wait=True)
+    if acquired is not None:
+        slot, frame = acquired
+        renderer.render_packed(fluid.density, frame, SHIFTS)
+        recorder.submit(slot, fluid.N, fluid.N)
+
+
+#Simulation steps Schritte (je fluid.advance(), mit fluid.cfl adaptiv in Teilschritten) lang laufen lassen
+#gibt Zeit, Schritte pro Sekunde und die simulierte Zeit zurück
+#frames: optionaler FrameRecorder, dem nach jedem Schritt ein Bild der Dichte angeboten wird (renderer: DensityRenderer)
+#first_step: Nummer des ersten Schritts (nach einem Neustart der Schritt des Checkpoints), der Schedule zählt ab dort weiter
+def run(fluid, steps, schedule=(), frames=None, renderer=None, first_step=0):
+    start = time.perf_counter()
+    for step in range(first_step, first_step + steps):
+        apply_schedule(fluid, schedule, step)
+        fluid.advance()
+        if frames is not None:
+            record_frame(frames, renderer, fluid)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "N": fluid.N,
+        "steps": steps,
+        "seconds": elapsed,
+        "steps_per_second": steps / elapsed if elapsed > 0 else float("inf"),
+        "substeps": fluid.total_substeps,
+        "capped_steps": fluid.capped_steps,
+        "sim_time": fluid.sim_time,
+        "sim_time_per_second": fluid.sim_time / elapsed if elapsed > 0 else float("inf"),
+        "threads": fluid.threads,
+        "parallel_efficiency": fluid.parallel_efficiency,
+        "particles": fluid.particles.count if fluid.particles is not None else 0,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the fluid simulation without a window.")
+    parser.add_argument("--N", type=int, default=200, help="grid size (cells per side)")
+    parser.add_argument("--dt", type=float, default=0.3, help="time step")
+    parser.add_argument("--visc", type=float, default=0.001, help="viscosity")
+    parser.add_argument("--steps", type=int, default=500, help="number of simulation steps")
+    parser.add_argument("--order", type=int, default=1, help="interpolation order of the advection")
+    parser.add_argument("--dyes", type=int, default=0, help="number of passive dye channels")
+    parser.add_argument("--particles", type=int, default=0, help="capacity of the tracer particle pool")
+    parser.add_argument("--threads", type=int, default=1, help="threads for FFTs and row-blocked advection")
+    parser.add_argument("--cfl", type=float, help="adaptive substeps: at most this many cells of motion per substep")
+    parser.add_argument("--max-substeps", type=int, default=8, help="upper limit of adaptive substeps per step")
+    parser.add_argument("--interval", type=float,
+                        help="simulated time per step (default: dt); with --cfl calm flow takes it in one step")
+    parser.add_argument("--schedule", help="JSON file with density/force events (default: centred source)")
+    parser.add_argument("--save", help="write the final u, v and density to this .npz file")
+    parser.add_argument("--record", help="record the state to this directory (memory-mapped .npy files)")
+    parser.add_argument("--record-every", type=int, default=10, help="record every k-th step")
+    parser.add_argument("--record-frames", type=int, default=1000, help="preallocated number of recorded frames")
+    parser.add_argument("--record-compress", action="store_true", help="write compressed .npz chunks instead")
+    parser.add_argument("--diagnostics", help="collect spectral diagnostics and write their history to this .npz file")
+    parser.add_argument("--diagnostics-every", type=int, default=1, help="evaluate the diagnostics every k-th step")
+    parser.add_argument("--idle", action="store_true", help="skip advection and projection while the flow is at rest")
+    parser.add_argument("--frames", help="record images of the density to this .gif file or PNG directory")
+    parser.add_argument("--frames-every", type=int, default=5,
+                        help="record every k-th step as an image (the solver waits for the encoders, no image is dropped)")
+    parser.add_argument("--colormap", default="inferno", choices=sorted(COLORMAPS), help="colormap of the recorded images")
+    parser.add_argument("--restart", help="start from a frame of the recording in this directory")
+    parser.add_argument("--restart-step", type=int, help="step of the restart frame (default: last recorded)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.schedule:
+        with open(args.schedule) as f:
+            schedule = json.load(f)
+    else:
+        schedule = default_schedule(args.N)
+
+    fluid = FluidSimulation(args.N, args.dt, args.visc, order=args.order, threads=args.threads, dyes=args.dyes)
+    fluid.cfl = args.cfl
+    if args.particles:
+        fluid.add_particles(args.particles)
+    fluid.max_substeps = args.max_substeps
+    fluid.interval = args.interval
+    if args.idle:
+        fluid.add_activity_tracker()
+    if args.diagnostics:
+        fluid.add_diagnostics(window=max(1, min(args.steps, 10000)), every=args.diagnostics_every)
+    restart_step = 0
+    if args.restart:
+        fluid, restart_step = restore(args.restart, args.restart_step, fluid)
+        print(f"restarted from step {restart_step} of {args.restart}")
+
+    recorder = None
+    if args.record:
+        recorder = StateRecorder(fluid, args.record, every=args.record_every, frames=args.record_frames,
+                                 compress=args.record_compress, first_step=restart_step).start()
+    frames = renderer = None
+    if args.frames:
+        frames = FrameRecorder(args.frames, every=args.frames_every, max_size=(fluid.N, fluid.N))
+        renderer = DensityRenderer()
+        renderer.set_colormap(args.colormap)
+    try:
+        stats = run(fluid, args.steps, schedule, frames, renderer, restart_step)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if frames is not None:
+            frames.close()
+
+    print(f"N={stats['N']}  steps={stats['steps']}  time={stats['seconds']:.3f}s  "
+          f"{stats['steps_per_second']:.1f} steps/s  substeps={stats['substeps']}  "
+          f"sim time/s={stats['sim_time_per_second']:.2f}")
+    if stats["capped_steps"]:
+        print(f"warning: --max-substeps {fluid.max_substeps} missed the CFL target in {stats['capped_steps']} steps "
+              f"(last step moved {fluid.last_cfl:.2f} cells per substep)")
+    if stats["particles"]:
+        print(f"particles={stats['particles']}")
+    if fluid.activity is not None:
+        print(f"idle steps={fluid.activity.skipped}  state={fluid.activity.mode}")
+    if stats["parallel_efficiency"] is not None:
+        print(f"threads={stats['threads']}  parallel efficiency (advection)={stats['parallel_efficiency']:.2f}")
+    if recorder is not None:
+        print(f"recorded {recorder.written} frames to {args.record}  dropped={recorder.dropped}")
+    if fluid.diagnostics is not None and fluid.diagnostics.count:
+        latest = fluid.diagnostics.latest()
+        print(f"energy={latest['energy']:.4g}  enstrophy={latest['enstrophy']:.4g}  "
+              f"divergence={latest['divergence']:.3g}  mass={latest['mass']:.6g}")
+        np.savez(args.diagnostics, **{name: fluid.diagnostics.history(name)
+                                      for name in SpectralDiagnostics.NAMES + ("spectrum", "steps")})
+    if frames is not None:
+        print(f"recorded {frames.recorded} images to {args.frames}  dropped={frames.dropped}")
+
+    if args.save:
+        particles = fluid.particles.positions() if fluid.particles is not None else (np.empty(0), np.empty(0))
+        np.savez(args.save, u=fluid.u, v=fluid.v, density=fluid.density, dyes=fluid.dyes,
+                 particles_x=particles[0], particles_y=particles[1])
+
+    return stats
+
+
+if __name__ == "__main__":
+    main()
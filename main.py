@@ -1,8 +1,17 @@
 #Hauptprogrammm, dass fluid simulation in pygame visualisiert und einstellungen ermöglicht
 
 from fluid_class import FluidSimulation
+from headless import inject_density, inject_dye, inject_force, emit_particles, set_parameters
+from replay import InputLog, RecordingSolver
+from solver_thread import SyncSolver, SimulationThread
+from rendering import DensityRenderer, DyeRenderer, COLORMAPS, velocity_glyphs, draw_segments, draw_points, pack_colour
+from fluid_functions import speed, vorticity
+from profiling import AutoResolution
+from particles import particle_image
+from frame_recorder import FrameRecorder, MASKS
+import argparse
+import time
 import numpy as np
-from scipy.ndimage import gaussian_filter
 import pygame
 import pygame_widgets
 from pygame_widgets.button import Button
@@ -52,33 +61,65 @@ def sync_textbox_input(textbox, slider, is_integer=False):
     return value
 
 
-#dichtefeld wird auf ein surface gezeichnet, eingabe von farbwerten ist möglich
-def visualisation(surf, density, r, g, b):
-    density_mask = density.copy()
-    density_mask[density_mask < 1e-10] = 0
-    density_mask = np.log1p(density_mask * 10)  #kleinere dichten länger darstellen
-
-    #normalisieren und kleiner extra term um division durch 0 zu verhindern
-    normalized = (density_mask - np.min(density_mask)) / (np.max(density_mask) - np.min(density_mask) + 1e-17)
-    normalized = np.clip(normalized, 0.0, 1.0)
-
-    #rgb matrizen im benötitgem vormat berechnen
-    rgb_1 = (normalized * r).astype(np.uint8)
-    rgb_2 = (normalized * g).astype(np.uint8)
-    rgb_3 = (normalized * b).astype(np.uint8)
-
-    #mit rgb matrizen auf surface zeichnen
-    pygame.surfarray.blit_array(surf, np.stack([rgb_1, rgb_2, rgb_3], axis=-1))
-
-
-def main():
+#Löser für den Render-Loop erstellen: im eigenen Thread oder synchron im Loop, mit input_log werden alle Eingaben protokolliert
+def make_solver(fluid, threaded, substeps, input_log=None):
+    if threaded:
+        solver = SimulationThread(fluid, substeps, frame_interval=1 / 60).start()
+    else:
+        solver = SyncSolver(fluid, substeps)
+    return solver if input_log is None else RecordingSolver(solver, input_log)
+
+
+#dichtefeld wird über die Farbtabelle des renderers direkt in die Pixel des (32 Bit) surface geschrieben
+def visualisation(surf, density, renderer):
+    pixels = pygame.surfarray.pixels2d(surf)            #View auf die Pixel, sperrt das surface
+    renderer.render_packed(density, pixels, surf.get_shifts()[:3])
+    del pixels                                          #surface wieder freigeben, damit es skaliert werden kann
+
+
+#Bildebenen, die statt der Dichte angezeigt werden können: Name -> (Feld aus (u, v, density), Farbverlauf, Skalierung)
+#mit Farbstoffen kommt die Ebene "Dyes" dazu (RGB Mischung aller Farbstoffe)
+FIELD_LAYERS = {
+    "Density": None,
+    "Speed": (lambda u, v, density: speed(u, v), "inferno", "linear"),
+    "Vorticity": (lambda u, v, density: vorticity(u, v), "coolwarm", "symmetric"),
+}
+
+
+#threaded: Simulation in einem eigenen Thread, substeps: Simulationsschritte pro angezeigtem Frame
+#target_ms: wenn gesetzt, wird die Auflösung automatisch so gewählt, dass die Rechenzeit pro Frame etwa target_ms bleibt
+#cfl: wenn gesetzt, wird jeder Zeitschritt adaptiv in Teilschritte zerlegt (siehe FluidSimulation.advance)
+#interval: Simulationszeit pro Schritt (Standard dt), mit cfl größer als dt: ruhige Strömung rechnet dann in großen Schritten
+#threads: Threads für FFTs und die zeilenweise Advektion innerhalb eines Schritts
+#dyes: Anzahl der Farbstoffe, die linke Maustaste bringt zusätzlich den gewählten Farbstoff ein (Tasten 1-9)
+#particles: Größe des Pools der Tracer-Teilchen, die linke Maustaste erzeugt zusätzlich Teilchen
+#frames: .gif Datei oder Verzeichnis, in das jeder frames_every-te Frame des Simulationsbildes aufgenommen wird
+#record_input: Ereignisdatei (.npz), in die alle Eingaben für replay.py geschrieben werden
+#diagnostics: spektrale Kenngrößen (Energie, Enstrophie, Divergenz, Masse) berechnen und bei den Laufzeiten anzeigen
+#idle: ruhende Strömung erkennen und dann Advektion und Projektion auslassen (siehe activity.py)
+def main(threaded=False, substeps=1, target_ms=None, cfl=None, threads=1, dyes=0, particles=0, frames=None, frames_every=2,
+         record_input=None, diagnostics=False, idle=True, interval=None):
     #Parameter für die fluidsimulation initialisieren
     N = 200
     dt = 0.3
     visc = 0.001
 
     # Fluid initialisieren
-    fluid = FluidSimulation(N, dt, visc)
+    fluid = FluidSimulation(N, dt, visc, threads=threads, dyes=dyes)
+    fluid.cfl = cfl
+    fluid.interval = interval
+    if particles:
+        fluid.add_particles(particles)
+    if diagnostics:
+        fluid.add_diagnostics()
+    if idle:
+        fluid.add_activity_tracker()
+    particle_rate = max(1, particles // 600)                     #Teilchen pro Frame, füllt den Pool in etwa 10 s
+    input_log = InputLog(fluid) if record_input else None
+    solver = make_solver(fluid, threaded, substeps, input_log)
+    auto_resolution = AutoResolution(target_ms / 1000) if target_ms else None
+    frame_recorder = FrameRecorder(frames, fps=60 / frames_every, every=frames_every) if frames else None
+    record_surfs = {}                                            #(slot, N) -> Surface direkt auf dem Shared Memory
 
     #Pygame initialisieren
     pygame.init()
@@ -88,13 +129,23 @@ def main():
     clock = pygame.time.Clock()                                  #clock für fps beschränkung
     try:
         font = pygame.font.Font("assets/Montserrat-Regular.ttf", 20)    #schriftart setzen
+        small_font = pygame.font.Font("assets/Montserrat-Regular.ttf", 14)
     except:
         font = pygame.font.Font(None, 20)                        #wenn nicht möglich standard schriftart
+        small_font = pygame.font.Font(None, 16)
 
     #Surfaces definieren
-    #quadratisches Surface für Simulation
-    sim_surf = pygame.Surface((fluid.N, fluid.N))
+    #quadratisches Surface für Simulation (32 Bit, damit die Pixel als uint32 beschrieben werden können)
+    #Pixelformat wie die Puffer des FrameRecorder, damit beim Aufnehmen direkt in dessen Shared Memory gezeichnet werden kann
+    sim_surf = pygame.Surface((fluid.N, fluid.N), 0, 32, MASKS)
     sim_surf_rect = pygame.Rect(0, 0, fluid.N * fluid.scaling_factor, fluid.N * fluid.scaling_factor)       #rectangel zum leichteren plazieren
+    scaled_sim_surf = pygame.Surface(sim_surf_rect.size, 0, 32, MASKS)   #wird jeden frame wiederverwendet
+    renderer = DensityRenderer()                                  #Farbtabelle für die Dichte
+    layer_renderer = DensityRenderer()                            #Farbtabelle für Geschwindigkeit/Wirbelstärke
+    dye_renderer = DyeRenderer()                                  #RGB Mischung der Farbstoffe
+    particle_renderer = DensityRenderer()                         #Dichtebild der Teilchen
+    particle_renderer.set_colormap("inferno")
+    particle_counts = np.zeros(scaled_sim_surf.get_size(), dtype=np.float32)
 
     #Surface am rechten Rand für Einstellungen
     set_surf = pygame.Surface((width - fluid.N * fluid.scaling_factor, height))
@@ -170,12 +221,49 @@ def main():
 
     #Reset Button
     widget_y += 50
-    reset_btn = Button(screen, widget_x, widget_y, 100, 30, text="Reset", onRelease=lambda: fluid.clear())
+    reset_btn = Button(screen, widget_x, widget_y, 100, 30, text="Reset", onRelease=lambda: solver.submit(FluidSimulation.clear))
 
     #Geschwindigkeitsfeld einblenden/ausblenden button
     widget_y += 50
     vel_btn = Button(screen, widget_x, widget_y, 100, 30, text="Velocity", onRelease=lambda: fluid.draw())
 
+    #angezeigtes Feld durchschalten: Dichte, Geschwindigkeitsbetrag, Wirbelstärke (und Farbstoffe)
+    layer_names = list(FIELD_LAYERS) + (["Dyes"] if dyes else [])
+    field_layer = "Dyes" if dyes else "Density"
+    dye_channel = 0                                     #Farbstoff für die linke Maustaste
+    def next_layer():
+        nonlocal field_layer
+        field_layer = layer_names[(layer_names.index(field_layer) + 1) % len(layer_names)]
+
+    layer_btn = Button(screen, widget_x - 110, widget_y, 100, 30, text="Field", onRelease=next_layer)
+    layer_label_pos = (widget_x - 110, widget_y + 35)
+
+    #Laufzeiten der Simulationsphasen einblenden/ausblenden button
+    show_timings = False
+    def toggle_timings():
+        nonlocal show_timings
+        show_timings = not show_timings
+
+    widget_y += 50
+    timings_btn = Button(screen, widget_x, widget_y, 100, 30, text="Timings", onRelease=toggle_timings)
+
+    #Darstellung der Tracer-Teilchen durchschalten: Punktwolke, Dichtebild in Fenstergröße, aus
+    particle_modes = ["Points", "Image", "Off"]
+    particle_mode = particle_modes[0]
+    def next_particle_mode():
+        nonlocal particle_mode
+        particle_mode = particle_modes[(particle_modes.index(particle_mode) + 1) % len(particle_modes)]
+
+    if particles:
+        particles_btn = Button(screen, widget_x - 110, widget_y, 100, 30, text="Particles", onRelease=next_particle_mode)
+
+    #Farbverlauf Auswahl, "Sliders" benutzt die RGB Slider
+    widget_y += 50
+    colormap_dropdown = Dropdown(screen, widget_x, widget_y, 100, 30, name="Sliders",
+                                 choices=["Sliders"] + [name.capitalize() for name in COLORMAPS],
+                                 values=[None] + list(COLORMAPS), fontSize=18)
+    timings_y = widget_y + 50
+
     #Info Text zum anzeigen des Info surfaces
     info = font.render("INFO", True, "white")
     info_rect = res_title.get_rect(bottomright=(width + 50, height))
@@ -186,6 +274,8 @@ def main():
         "Controls:",
         "- Left Mouse: Add Fluid Density",
         "- Right Mouse: Create Fluid Movement",
+        "- Keys 1-9: Choose dye colour (--dyes)",
+        "- Left Mouse also emits tracers (--particles)",
         "",
         "Parameters:",
         "- Timestep: Controls simulation speed",
@@ -197,10 +287,14 @@ def main():
         "Color Sliders:",
         "Adjust Red, Green, Blue to change",
         "fluid visualization color",
+        "or pick a colormap from the list",
         "",
         "Buttons:",
         "- Reset: Clear simulation",
-        "- Velocity: Toggle velocity vectors"
+        "- Velocity: Toggle velocity vectors",
+        "- Field: Show density, speed, vorticity, dyes",
+        "- Timings: Show solver stage timings",
+        "- Particles: Points, image or off"
     ]
     #array mit den texten für surface erstellen
     info_text_surface = []
@@ -228,6 +322,12 @@ def main():
 #
             #beim drücken auf x programm schließen
             if event.type == pygame.QUIT:
+                solver.stop()
+                if input_log is not None:
+                    input_log.save(record_input)
+                if frame_recorder is not None:
+                    record_surfs.clear()
+                    frame_recorder.close()
                 pygame.quit()
                 exit()
 
@@ -240,6 +340,10 @@ def main():
                     right_mouse_down = True
                     prev_mouse_pos = pygame.mouse.get_pos()
 
+            #Farbstoff wählen
+            if event.type == pygame.KEYDOWN and pygame.K_1 <= event.key < pygame.K_1 + min(dyes, 9):
+                dye_channel = event.key - pygame.K_1
+
             if event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:
                     left_mouse_down = False
@@ -249,14 +353,22 @@ def main():
 
 
         #Aktion bei Drücken der linken oder rechten Maustaste
-        if left_mouse_down or right_mouse_down:
+        #außerhalb des Simulationsbereichs (z.B. über den Einstellungen) keine Eingabe, die Pinsel würden sonst
+        #periodisch am gegenüberliegenden Rand landen. Die Kraft beginnt beim Zurückkehren mit einer neuen Bewegung
+        if (left_mouse_down or right_mouse_down) and not sim_surf_rect.collidepoint(pygame.mouse.get_pos()):
+            prev_mouse_pos = None
+        elif left_mouse_down or right_mouse_down:
             x, y = pygame.mouse.get_pos()           #derzeitige position der maus
             x = int(x / fluid.scaling_factor)       #skalieren auf größe der simulation, da das eigentliche Grid nur Nh² pixel groß ist
             y = int(y / fluid.scaling_factor)
 
+            #Eingaben werden an den Löser übergeben und dort vor dem nächsten Schritt ausgeführt
             if left_mouse_down:
-                fluid.density[x-radius:x+radius+1, y-radius:y+radius+1] = 1.0     #dichte werte an mausposition setzen
-                fluid.density = gaussian_filter(fluid.density, sigma=1.0 * fluid.N/150)           #glätten
+                solver.submit(inject_density, x, y, radius)         #dichte werte an mausposition setzen und glätten
+                if dyes:
+                    solver.submit(inject_dye, dye_channel, x, y, radius)
+                if particles:
+                    solver.submit(emit_particles, x, y, particle_rate, radius / 2)
 
             #wenn rechtemaustaste gedrückt und die letzte mausposition nicht none ist
             if right_mouse_down and prev_mouse_pos:
@@ -266,53 +378,71 @@ def main():
 
                 dx = x - prev_x                                     #Richtung der mausbewegung berechnen
                 dy = y - prev_y
-                speed_factor = np.sqrt(dx**2 + dy**2) * 0.001       #stärke der kraft mit länge der bewegung skalieren
-                #kraft bezüglich radius und speed werte im kraftfelder einsetzen
-                force_radius = max( 1, radius // 2 )               #kleinerer Radius für die kraft
-                fluid.uforce[x-force_radius:x+force_radius+1, y-force_radius:y+force_radius+1] = dy * speed_factor * speed_input_value
-                fluid.vforce[x-force_radius:x+force_radius+1, y-force_radius:y+force_radius+1] = dx * speed_factor * speed_input_value
-
-                #glätten
-                fluid.uforce = gaussian_filter(fluid.uforce, sigma=0.5)
-                fluid.vforce = gaussian_filter(fluid.vforce, sigma=0.5)
+                #kraft bezüglich radius und speed werte im kraftfelder einsetzen und glätten
+                solver.submit(inject_force, x, y, radius, dx, dy, speed_input_value)
 
+            if right_mouse_down:
                 prev_mouse_pos = pygame.mouse.get_pos()
 
-        #Simulationsschritt ausführen
-        fluid.step()
-
-        #Dichtefeld des Fluids visualisieren
-        visualisation(
-            sim_surf,
-            fluid.density,
-            red_slider.getValue(),
-            green_slider.getValue(),
-            blue_slider.getValue()
-        )
-
-        #simulations surface auf fenstergröße skalieren
-        scaled_sim_surf = pygame.transform.scale(sim_surf, (fluid.N * fluid.scaling_factor, fluid.N * fluid.scaling_factor))
-
-        #Geschwindigkeitsfeld zeichnen (wenn angeschaltet)
-        if fluid.draw_velocity:
-            n = max(1, fluid.N // 40)           #anzahl vektoren gleichbleibend
-            for i in range(0, fluid.N, n):      #jeden n-ten vektoren zwischenspeichern
-                for j in range(0, fluid.N, n):
-                    u = fluid.v[i, j]
-                    v = fluid.u[i, j]
-                    #zu große vektoren skalieren
-                    max_speed = 2.0
-                    speed = np.hypot(u, v)
-                    if speed > max_speed:
-                        u *= max_speed / speed
-                        v *= max_speed / speed
-
-                    #start und endpunkt der vektoren, wobei sie um faktor 5 gestreckt werden
-                    start_pos = (i * fluid.scaling_factor, j * fluid.scaling_factor)
-                    end_pos = (int((i + u * 5) * fluid.scaling_factor), int((j + v * 5) * fluid.scaling_factor))
-
-                    #surface, farbe, start, end, dicke
-                    pygame.draw.line(scaled_sim_surf, (0, 239, 255), start_pos, end_pos, 1)
+        #Simulationsschritt ausführen (im Thread-Modus rechnet der Löser unabhängig davon weiter)
+        solver.advance()
+
+        #beim Aufnehmen direkt in einen freien Puffer des FrameRecorder zeichnen (kein Kopieren), sonst in sim_surf
+        frame_surf = sim_surf
+        acquired = frame_recorder.acquire(fluid.N, fluid.N) if frame_recorder is not None else None
+        if acquired is not None:
+            key = (acquired[0], fluid.N)
+            if key not in record_surfs:
+                record_surfs[key] = pygame.image.frombuffer(frame_recorder.buffer(*key, fluid.N), (fluid.N, fluid.N), "RGBX")
+            frame_surf = record_surfs[key]
+
+        #letzten fertigen Zustand zeichnen
+        with solver.snapshot() as (u_field, v_field, density, dye_fields, tracers):
+            #Farbtabelle wählen (wird nur bei Änderung neu gebaut) und Dichtefeld des Fluids visualisieren
+            layer = FIELD_LAYERS.get(field_layer)
+            if field_layer == "Dyes":
+                pixels = pygame.surfarray.pixels2d(frame_surf)
+                dye_renderer.render_packed(dye_fields, pixels, frame_surf.get_shifts()[:3])
+                del pixels
+            elif layer is None:
+                colormap = colormap_dropdown.getSelected()
+                if colormap:
+                    renderer.set_colormap(colormap)
+                else:
+                    renderer.set_tint(red_slider.getValue(), green_slider.getValue(), blue_slider.getValue())
+                visualisation(frame_surf, density, renderer)
+            else:
+                #Geschwindigkeitsbetrag oder Wirbelstärke als Bildebene
+                field, colormap, scale = layer
+                layer_renderer.set_colormap(colormap)
+                pixels = pygame.surfarray.pixels2d(frame_surf)
+                layer_renderer.render_packed(field(u_field, v_field, density), pixels, frame_surf.get_shifts()[:3], scale)
+                del pixels
+
+            #simulations surface auf fenstergröße in das vorhandene surface skalieren
+            pygame.transform.scale(frame_surf, scaled_sim_surf.get_size(), scaled_sim_surf)
+            if acquired is not None:
+                frame_recorder.submit(acquired[0], fluid.N, fluid.N, time.perf_counter())   #Anzeigedauer aus der Echtzeit
+
+            #Tracer-Teilchen als Punktwolke oder als Dichtebild in Fenstergröße (feiner als das Gitter)
+            if particles and particle_mode != "Off":
+                pixels = pygame.surfarray.pixels2d(scaled_sim_surf)
+                shifts = scaled_sim_surf.get_shifts()[:3]
+                if particle_mode == "Points":
+                    particle_x, particle_y = tracers
+                    draw_points(pixels, particle_x, particle_y, fluid.scaling_factor, pack_colour((255, 255, 255), shifts))
+                else:
+                    particle_image(*tracers, fluid.N, particle_counts.shape[0], out=particle_counts)
+                    particle_renderer.render_packed(particle_counts, pixels, shifts)
+                del pixels
+
+            #Geschwindigkeitsfeld zeichnen (wenn angeschaltet), alle Pfeile in einem numpy Durchgang
+            if fluid.draw_velocity:
+                n = max(1, fluid.N // 40)           #anzahl vektoren gleichbleibend
+                starts, ends = velocity_glyphs(u_field, v_field, n, fluid.scaling_factor)
+                pixels = pygame.surfarray.pixels2d(scaled_sim_surf)
+                draw_segments(pixels, starts, ends, pack_colour((0, 239, 255), scaled_sim_surf.get_shifts()))
+                del pixels
 
         #Zeichnen des Simulations und Einstellungs surface
         screen.blit(scaled_sim_surf, (0, 0))
@@ -332,16 +462,28 @@ def main():
 
 
         #Fluid Simulations werte neu setzen
-        fluid.visc = visc_slider.getValue()
+        if fluid.visc != visc_slider.getValue() or fluid.dt != timestep_slider.getValue():
+            solver.submit(set_parameters, timestep_slider.getValue(), visc_slider.getValue())
         radius_percent = radius_slider.getValue() / 1000.0
         radius = max(1, int(fluid.N * radius_percent))
         speed_input_value = speed_slider.getValue()
-        fluid.dt = timestep_slider.getValue()
 
-        #bei ändern der Auflösung fluid mit neuem N initialisieren und Surface neu zeichnen da sich scaling_factor ändert
+        #automatische Auflösung: gemessene Schrittzeit * substeps als Rechenzeit pro Frame, stellt den Slider
+        #ausgelassene Schritte einer ruhenden Strömung sagen nichts über die Rechenzeit aus
+        if auto_resolution is not None and (fluid.activity is None or fluid.activity.mode == "active"):
+            step_time = fluid.profiler.last("step")
+            if step_time is not None:
+                res_slider.setValue(auto_resolution.update(fluid.N, step_time * substeps))
+
+        #bei ändern der Auflösung den Zustand spektral auf das neue N umrechnen und Surface neu anlegen da sich scaling_factor ändert
         if fluid.N != int(res_slider.getValue()):
-            fluid = FluidSimulation(res_slider.getValue(), dt, visc)
-            sim_surf = pygame.Surface((fluid.N, fluid.N))
+            solver.stop()
+            if input_log is not None:
+                input_log.apply(fluid, FluidSimulation.resize, (res_slider.getValue(),))
+            else:
+                fluid.resize(res_slider.getValue())
+            solver = make_solver(fluid, threaded, substeps, input_log)
+            sim_surf = pygame.Surface((fluid.N, fluid.N), 0, 32, MASKS)
             sim_surf_rect = pygame.Rect(0, 0, fluid.N * fluid.scaling_factor, fluid.N * fluid.scaling_factor)
 
         #Texte auf Einsellungs surface zeichnen
@@ -352,6 +494,28 @@ def main():
         screen.blit(res_title, res_title_rect)
         screen.blit(colour_title, colour_title_rect)
         screen.blit(info, info_rect)
+        screen.blit(small_font.render(field_layer, True, "white"), layer_label_pos)
+
+        #Laufzeiten der Phasen von fluid.step() im Einstellungsbereich anzeigen (mean / p95 / max)
+        if show_timings:
+            timings_x = fluid.N * fluid.scaling_factor + 15
+            screen.blit(small_font.render("stage   mean / p95 / max [ms]", True, "white"), (timings_x, timings_y))
+            lines = [f"{name}: {stats['mean']*1e3:.2f} / {stats['p95']*1e3:.2f} / {stats['max']*1e3:.2f}"
+                     for name, stats in fluid.timings().items()]
+            if fluid.cfl is not None:
+                lines.append(f"dt {float(fluid.last_dt):.3f} x {fluid.last_substeps} substeps, {fluid.last_cfl:.2f} cells")
+                if fluid.last_cfl > fluid.cfl:
+                    lines.append(f"substep limit reached ({fluid.capped_steps} times)")
+            if fluid.parallel_efficiency is not None:
+                lines.append(f"{fluid.threads} threads, efficiency {fluid.parallel_efficiency:.0%}")
+            if fluid.activity is not None and fluid.activity.mode != "active":
+                lines.append(f"flow at rest ({fluid.activity.mode}), step skipped")
+            latest = fluid.diagnostics.latest() if fluid.diagnostics is not None else None
+            if latest is not None:
+                lines.append(f"energy {latest['energy']:.3g}  enstrophy {latest['enstrophy']:.3g}")
+                lines.append(f"divergence {latest['divergence']:.2g}  mass {latest['mass']:.4g}")
+            for i, line in enumerate(lines):
+                screen.blit(small_font.render(line, True, "lightgrey"), (timings_x, timings_y + 20 * (i + 1)))
 
         #Info surface zeichnen, wenn maus auf info text ist
         if info_rect.collidepoint(pygame.mouse.get_pos()):
@@ -366,4 +530,20 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Interactive fluid simulation.")
+    parser.add_argument("--threaded", action="store_true", help="run the solver in a background thread")
+    parser.add_argument("--substeps", type=int, default=1, help="simulation steps per displayed frame")
+    parser.add_argument("--target-ms", type=float, help="pick the resolution automatically to hold this compute time per frame")
+    parser.add_argument("--cfl", type=float, help="adaptive substeps: at most this many cells of motion per substep")
+    parser.add_argument("--interval", type=float, help="simulated time per step (default: dt); with --cfl calm flow takes it in one step")
+    parser.add_argument("--threads", type=int, default=1, help="threads for FFTs and row-blocked advection")
+    parser.add_argument("--dyes", type=int, default=0, help="number of coloured dye channels")
+    parser.add_argument("--particles", type=int, default=0, help="capacity of the tracer particle pool")
+    parser.add_argument("--frames", help="record the simulation image to this .gif file or PNG directory")
+    parser.add_argument("--frames-every", type=int, default=2, help="record every k-th displayed frame")
+    parser.add_argument("--record-input", help="log every input to this event file for replay.py")
+    parser.add_argument("--diagnostics", action="store_true", help="show energy, enstrophy, divergence and mass with the timings")
+    parser.add_argument("--no-idle", action="store_true", help="keep computing full steps while the flow is at rest")
+    args = parser.parse_args()
+    main(args.threaded, args.substeps, args.target_ms, args.cfl, args.threads, args.dyes, args.particles,
+         args.frames, args.frames_every, args.record_input, args.diagnostics, not args.no_idle, args.interval)
@@ -0,0 +1,167 @@
+#Masselose Tracer-Teilchen, die mit dem Geschwindigkeitsfeld der Simulation mitschwimmen
+#Structure of Arrays: x, y und age sind float32 Arrays der Länge capacity, die aktiven Teilchen liegen dicht
+#in [0, count) und sind nach Alter sortiert (die ältesten vorne). Es gibt keine Python-Objekte pro Teilchen.
+#Koordinaten in Zellen wie in main.py: x entlang der ersten Feldachse (Fenster x), y entlang der zweiten,
+#der Mittelpunkt der Zelle i liegt bei i + 0.5. Entlang x bewegt v, entlang y bewegt u.
+
+import numpy as np
+from fluid_functions import bilinear_stencil, empty_stencil, interpolate_bilinear
+
+
+#Positionen periodisch nach [0, N) einfalten, mask ist ein bool Puffer gleicher Länge
+#die Teilchen bewegen sich pro Schritt weniger als N Zellen, daher reicht ein Vergleich statt np.remainder
+#(das für float32 ein Vielfaches kostet)
+def wrap(position, Gridsize, mask):
+    np.greater_equal(position, Gridsize, out=mask)
+    np.subtract(position, Gridsize, out=position, where=mask)
+    np.less(position, 0, out=mask)
+    np.add(position, Gridsize, out=position, where=mask)
+    return position
+
+
+class TracerParticles:
+
+    def __init__(self, Gridsize, capacity, lifetime=None, seed=None, order=1):
+        self.N = Gridsize               # Gittergröße der Simulation (periodischer Rand)
+        self.capacity = capacity        # maximale Anzahl der Teilchen
+        self.lifetime = lifetime        # maximales Alter in Simulationszeit, None = unbegrenzt
+        self.order = order              # 1 = Euler-Schritt wie die Rückwärtsverfolgung der Felder, 2 = Mittelpunktregel
+        self.count = 0                  # Anzahl aktiver Teilchen
+        self.rng = np.random.default_rng(seed)
+
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.age = np.zeros(capacity, dtype=np.float32)
+
+        # Arbeitspuffer für die Interpolation, damit advect() keine Arrays der Größe capacity anlegt
+        self.Xb = np.empty(capacity, dtype=np.float32)
+        self.Yb = np.empty(capacity, dtype=np.float32)
+        self.stencil = empty_stencil((capacity,))
+        self.velocity = np.empty((2, capacity), dtype=np.float32)
+        self.middle = np.empty((2, capacity), dtype=np.float32)
+        self.work = np.empty(capacity, dtype=np.float32)
+        self.mask = np.empty(capacity, dtype=bool)
+
+    #Geschwindigkeit (entlang x, entlang y) an den Positionen x, y bilinear aus u, v, gleicher Stencil wie die Advektion
+    def sample(self, u, v, x, y):
+        n = len(x)
+        Xb, Yb = self.Xb[:n], self.Yb[:n]
+        np.copyto(Xb, y)            #Spaltenkoordinate (letzte Achse)
+        np.copyto(Yb, x)            #Zeilenkoordinate (erste Achse)
+        indices, weights = self.stencil
+        stencil = ([index[:n] for index in indices], [weight[:n] for weight in weights])
+        bilinear_stencil(Xb, Yb, self.N, out=stencil)
+
+        vx, vy = self.velocity[0][:n], self.velocity[1][:n]
+        interpolate_bilinear(v.reshape(-1), stencil, out=vx, work=self.work[:n])
+        interpolate_bilinear(u.reshape(-1), stencil, out=vy, work=self.work[:n])
+        return vx, vy
+
+    #Teilchen um dt mit dem Feld (u, v) bewegen, periodisch einfalten und altern lassen
+    def advect(self, u, v, dt):
+        n = self.count
+        if n == 0:
+            return
+        dt = np.float32(dt)
+        x, y = self.x[:n], self.y[:n]
+        mask = self.mask[:n]
+
+        vx, vy = self.sample(u, v, x, y)
+        if self.order == 2:
+            #halber Schritt mit der Geschwindigkeit am Ort, dann ganzer Schritt mit der Geschwindigkeit in der Mitte
+            mx, my = self.middle[0][:n], self.middle[1][:n]
+            for middle, position, velocity in ((mx, x, vx), (my, y, vy)):
+                np.multiply(velocity, dt / 2, out=middle)
+                middle += position
+                wrap(middle, self.N, mask)
+            vx, vy = self.sample(u, v, mx, my)
+
+        for position, velocity in ((x, vx), (y, vy)):
+            velocity *= dt
+            position += velocity
+            wrap(position, self.N, mask)
+
+        self.age_by(dt)
+
+    #Teilchen altern lassen und abgelaufene entfernen, auch ohne Bewegung (ruhende Strömung, siehe activity.py)
+    def age_by(self, dt):
+        n = self.count
+        self.age[:n] += dt
+        if self.lifetime is not None:
+            self.retire(self.age[:n] >= self.lifetime)
+
+    #Teilchen an den Positionen (x, y) erzeugen, mit count > 1 gaußverteilt (spread Zellen) um einen Punkt
+    #ist der Pool voll, werden die ältesten Teilchen wiederverwendet, gibt die Anzahl neuer Teilchen zurück
+    def emit(self, x, y, count=1, spread=0.0):
+        x = np.atleast_1d(np.asarray(x, dtype=np.float32)) + np.float32(0.5)      #Zellmittelpunkt
+        y = np.atleast_1d(np.asarray(y, dtype=np.float32)) + np.float32(0.5)
+        if count > 1:
+            x = np.repeat(x, count)
+            y = np.repeat(y, count)
+        if spread > 0:
+            x += self.rng.normal(0.0, spread, x.shape).astype(np.float32)
+            y += self.rng.normal(0.0, spread, y.shape).astype(np.float32)
+        x, y = x[-self.capacity:], y[-self.capacity:]
+        new = len(x)
+
+        overflow = self.count + new - self.capacity
+        if overflow > 0:
+            self.retire_oldest(overflow)
+        start, self.count = self.count, self.count + new
+        np.remainder(x, self.N, out=self.x[start:self.count])
+        np.remainder(y, self.N, out=self.y[start:self.count])
+        self.age[start:self.count] = 0
+        return new
+
+    #Teilchen mit mask=True entfernen, die übrigen rücken in Reihenfolge nach vorne
+    def retire(self, mask):
+        if not mask.any():
+            return
+        keep = np.flatnonzero(~mask)
+        for array in (self.x, self.y, self.age):
+            array[:len(keep)] = array[keep]
+        self.count = len(keep)
+
+    #die count ältesten Teilchen entfernen (liegen vorne)
+    def retire_oldest(self, count):
+        count = min(count, self.count)
+        remaining = self.count - count
+        for array in (self.x, self.y, self.age):
+            array[:remaining] = array[count:self.count]
+        self.count = remaining
+
+    #Positionen auf eine neue Gittergröße umrechnen (FluidSimulation.resize)
+    def rescale(self, Gridsize):
+        scale = np.float32(Gridsize / self.N)
+        self.x[:self.count] *= scale
+        self.y[:self.count] *= scale
+        self.N = Gridsize
+
+    def clear(self):
+        self.count = 0
+
+    #Positionen der aktiven Teilchen als Views (x, y), für eine Punktwolke
+    def positions(self):
+        return self.x[:self.count], self.y[:self.count]
+
+    #Teilchen in ein Dichtebild der Größe (size, size) einsortieren, siehe particle_image
+    def image(self, size, out=None):
+        return particle_image(self.x[:self.count], self.y[:self.count], self.N, size, out)
+
+
+#Teilchen an den Positionen (x, y) in ein Dichtebild der Größe (size, size) einsortieren (Anzahl pro Pixel),
+#Achsen wie die Felder. size kann größer als N sein, z.B. die Fenstergröße, dann zeigt das Bild Details unterhalb
+#einer Zelle. Auch für die Kopie der Positionen aus SimulationThread.snapshot()
+def particle_image(x, y, Gridsize, size, out=None):
+    scale = np.float32(size / Gridsize)
+    ix = (x * scale).astype(np.intp)
+    iy = (y * scale).astype(np.intp)
+    np.clip(ix, 0, size - 1, out=ix)
+    np.clip(iy, 0, size - 1, out=iy)
+    ix *= size
+    ix += iy
+    counts = np.bincount(ix, minlength=size * size).reshape(size, size)
+    if out is None:
+        return counts.astype(np.float32)
+    np.copyto(out, counts, casting='unsafe')
+    return out
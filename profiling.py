@@ -0,0 +1,128 @@
+#Zeitmessung der einzelnen Phasen eines Simulationsschritts mit rollierender Statistik (mean, p95, max)
+#und optionalen Callbacks vor und nach jeder Phase
+
+import time
+import numpy as np
+
+
+#Kontextmanager für eine Phase, als Klasse statt @contextmanager, damit der Aufwand pro Phase klein bleibt
+class Stage:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        for callback in self.profiler.before:
+            callback(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.profiler.record(self.name, elapsed)
+        for callback in self.profiler.after:
+            callback(self.name, elapsed)
+        return False
+
+
+class StageProfiler:
+
+    def __init__(self, window=120):
+        self.window = window        # Anzahl der letzten Messungen pro Phase für die Statistik
+        self.enabled = True
+        self.samples = {}           # Phase -> Ringpuffer mit Zeiten in Sekunden
+        self.counts = {}            # Phase -> Anzahl der Messungen insgesamt
+        self.stages = {}            # wiederverwendete Stage-Objekte
+        self.before = []            # callback(name)
+        self.after = []             # callback(name, sekunden)
+
+    #Kontextmanager für eine Phase: with profiler.stage("advection"): ...
+    def stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage(self, name)
+        return stage
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        buffer = self.samples.get(name)
+        if buffer is None:
+            buffer = self.samples[name] = np.zeros(self.window)
+            self.counts[name] = 0
+        buffer[self.counts[name] % self.window] = seconds
+        self.counts[name] += 1
+
+    #letzte Messung einer Phase in Sekunden, None wenn noch keine vorliegt
+    def last(self, name):
+        count = self.counts.get(name, 0)
+        if count == 0:
+            return None
+        return float(self.samples[name][(count - 1) % self.window])
+
+    #Callbacks vor und nach jeder Phase registrieren
+    def add_callbacks(self, before=None, after=None):
+        if before is not None:
+            self.before.append(before)
+        if after is not None:
+            self.after.append(after)
+
+    def remove_callbacks(self, before=None, after=None):
+        if before in self.before:
+            self.before.remove(before)
+        if after in self.after:
+            self.after.remove(after)
+
+    #Statistik pro Phase in Sekunden: last, mean, p95, max über die letzten window Messungen
+    def stats(self):
+        result = {}
+        for name, buffer in list(self.samples.items()):     #Liste, da der Löser-Thread neue Phasen eintragen kann
+            count = self.counts[name]
+            values = buffer[:min(count, self.window)]
+            result[name] = {
+                "last": float(buffer[(count - 1) % self.window]),
+                "mean": float(values.mean()),
+                "p95": float(np.percentile(values, 95)),
+                "max": float(values.max()),
+                "count": count,
+            }
+        return result
+
+    def reset(self):
+        self.samples.clear()
+        self.counts.clear()
+
+
+#Automatische Auflösung: wählt N so, dass die gemessene Rechenzeit pro Frame nahe target (Sekunden) bleibt
+#der Aufwand eines Schritts wächst etwa mit N², daher N_neu = N * sqrt(target / gemessen)
+#gemessen wird ein gleitender Mittelwert, nach einer Änderung erst wieder nach settle Messungen
+class AutoResolution:
+
+    def __init__(self, target, N_min=10, N_max=500, granularity=10, settle=30, tolerance=0.2):
+        self.target = target            # Ziel-Rechenzeit pro Frame in Sekunden
+        self.N_min = N_min
+        self.N_max = N_max
+        self.granularity = granularity  # N wird auf Vielfache davon gerundet (wie der Auflösungs-Slider)
+        self.settle = settle            # Messungen nach einer Änderung, bevor erneut geändert wird
+        self.tolerance = tolerance      # relative Abweichung vom Ziel, die noch toleriert wird
+        self.average = None
+        self.samples = 0
+
+    #neue Messung für die aktuelle Auflösung N, gibt die gewünschte Auflösung zurück
+    def update(self, N, seconds):
+        self.average = seconds if self.average is None else 0.9 * self.average + 0.1 * seconds
+        self.samples += 1
+        if self.samples < self.settle:
+            return N
+
+        ratio = self.target / max(self.average, 1e-9)
+        if abs(ratio - 1) < self.tolerance:
+            return N
+        new_N = int(round(N * np.sqrt(ratio) / self.granularity)) * self.granularity
+        new_N = max(self.N_min, min(self.N_max, new_N))
+        if new_N != N:
+            self.average = None
+            self.samples = 0
+        return new_N
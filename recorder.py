@@ -0,0 +1,238 @@
+#Aufzeichnung des Simulationszustands für die Auswertung und als Checkpoints zum Neustart
+#Jeder every-te Schritt wird in einen freien Puffer kopiert und von einem Schreib-Thread auf die Platte gebracht.
+#Ein Schritt ist ein fluid.advance() (wie in headless.run), mit fluid.cfl wird erst nach dessen letztem Teilschritt
+#aufgezeichnet, damit ein Neustart an derselben Schrittgrenze und mit derselben Schrittnummer weiterläuft:
+#   - in vorallokierte memory-mapped .npy Dateien (state.npy (frames, C, N, N), forces.npy, steps.npy)
+#   - oder mit compress=True in komprimierte Blöcke chunk_00000.npz mit je chunk Frames
+#Die Zahl der Puffer ist begrenzt: ist keiner frei (die Platte ist zu langsam), wird der Frame verworfen
+#und gezählt, der Löser wartet nie auf die Platte. Es liegt nie mehr als ein Block im Speicher.
+#
+#Beispiel:
+#   recorder = StateRecorder(fluid, "run1", every=10, frames=5000).start()
+#   ...  fluid.step() / solver.advance() ...
+#   recorder.close()
+#   fluid, step = restore("run1", step=2000)          #liest nur diesen einen Frame
+
+import json
+import os
+import queue
+import threading
+import numpy as np
+from fluid_class import FluidSimulation
+
+
+class StateRecorder:
+
+    #first_step: Schritt, bei dem die Aufzeichnung beginnt (nach restore() der Schritt des Checkpoints),
+    #damit die Schrittnummern einer fortgesetzten Simulation weiterlaufen
+    def __init__(self, fluid, path, every=1, frames=1000, queue_size=8, compress=False, chunk=32, flush_every=16,
+                 first_step=0):
+        self.fluid = fluid
+        self.path = path                    # Verzeichnis der Aufzeichnung
+        self.every = every                  # jeder every-te Schritt wird aufgezeichnet
+        self.frames = frames                # maximale Anzahl Frames (Größe der .npy Dateien)
+        self.compress = compress
+        self.chunk = chunk                  # Frames pro komprimiertem Block
+        self.flush_every = flush_every      # memmap und meta.json alle so viele Frames schreiben
+        self.shape = fluid.state.shape      # (C, ..., N, N), bei anderer Form (resize) wird nicht mehr aufgezeichnet
+
+        self.step = first_step              # Schritte (advance()) der Simulation, ab first_step gezählt
+        self.captured = 0                   # Frames, die an den Schreib-Thread gegeben wurden
+        self.written = 0                    # Frames auf der Platte
+        self.dropped = 0                    # verworfene Frames (kein freier Puffer, Datei voll, andere Form)
+        self.error = None
+
+        #Puffer für Zustand und Kräfte, frei -> gefüllt -> geschrieben -> frei
+        self.slots = np.empty((queue_size, self.shape[0] + 2) + self.shape[1:], dtype=np.float32)
+        self.free = queue.SimpleQueue()
+        for slot in range(queue_size):
+            self.free.put(slot)
+        self.pending = queue.SimpleQueue()
+        self.thread = None
+
+        os.makedirs(path, exist_ok=True)
+        self.meta = {
+            "N": fluid.N,
+            "dt": np.asarray(fluid.dt).tolist(),
+            "visc": np.asarray(fluid.visc).tolist(),
+            "order": fluid.order,
+            "batch_shape": list(fluid.batch_shape),
+            "dyes": fluid.channels - 3,
+            "every": every,
+            "compress": compress,
+            "chunk": chunk,
+            "first_step": first_step,
+            "frames": 0,
+        }
+        if compress:
+            self.buffer = np.empty((chunk,) + self.slots.shape[1:], dtype=np.float32)
+            self.buffer_steps = np.empty(chunk, dtype=np.int64)
+        else:
+            self.state = np.lib.format.open_memmap(os.path.join(path, "state.npy"), mode="w+",
+                                                   dtype=np.float32, shape=(frames,) + self.shape)
+            self.forces = np.lib.format.open_memmap(os.path.join(path, "forces.npy"), mode="w+",
+                                                    dtype=np.float32, shape=(frames, 2) + self.shape[1:])
+            self.steps = np.lib.format.open_memmap(os.path.join(path, "steps.npy"), mode="w+",
+                                                   dtype=np.int64, shape=(frames,))
+
+    #Schreib-Thread starten und nach jedem Schritt der Simulation aufzeichnen (Callback des Profilers)
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="state-recorder", daemon=True)
+        self.thread.start()
+        self.fluid.add_stage_callbacks(after=self.after_stage)
+        return self
+
+    def after_stage(self, name, seconds):
+        if name != "step" or self.fluid.open_substeps:
+            return
+        self.step += 1
+        if self.step % self.every == 0:
+            self.capture(self.fluid, self.step)
+
+    #Zustand in einen freien Puffer kopieren und zum Schreiben einreihen, blockiert nie
+    def capture(self, fluid, step):
+        if fluid.state.shape != self.shape or (not self.compress and self.captured >= self.frames):
+            self.dropped += 1
+            return False
+        try:
+            slot = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        buffer = self.slots[slot]
+        np.copyto(buffer[:-2], fluid.state)
+        np.copyto(buffer[-2], fluid.uforce)
+        np.copyto(buffer[-1], fluid.vforce)
+        self.pending.put((slot, self.captured, step))
+        self.captured += 1
+        return True
+
+    def run(self):
+        try:
+            while True:
+                item = self.pending.get()
+                if item is None:
+                    break
+                slot, frame, step = item
+                if self.compress:
+                    self.buffer[frame % self.chunk] = self.slots[slot]
+                    self.buffer_steps[frame % self.chunk] = step
+                    self.free.put(slot)
+                    if frame % self.chunk == self.chunk - 1:
+                        self.write_chunk(frame // self.chunk, self.chunk)
+                else:
+                    self.state[frame] = self.slots[slot][:-2]
+                    self.forces[frame] = self.slots[slot][-2:]
+                    self.steps[frame] = step
+                    self.free.put(slot)
+                    if (frame + 1) % self.flush_every == 0:
+                        self.flush(frame + 1)
+                self.written = frame + 1
+        except Exception as e:
+            self.error = e
+            while True:                     #Puffer freigeben, damit capture() weiter verwerfen statt hängen kann
+                try:
+                    self.free.put(self.pending.get_nowait()[0])
+                except (queue.Empty, TypeError):
+                    break
+
+    #einen vollen (oder beim Schließen den angefangenen) Block komprimiert schreiben
+    def write_chunk(self, index, count):
+        np.savez_compressed(os.path.join(self.path, f"chunk_{index:05d}.npz"),
+                            state=self.buffer[:count, :-2], forces=self.buffer[:count, -2:],
+                            steps=self.buffer_steps[:count])
+        self.write_meta(index * self.chunk + count)
+
+    def flush(self, frames):
+        for array in (self.state, self.forces, self.steps):
+            array.flush()
+        self.write_meta(frames)
+
+    def write_meta(self, frames):
+        self.meta["frames"] = frames
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(self.meta, f, indent=2)
+
+    #Aufzeichnung beenden: restliche Frames schreiben, Dateien abschließen
+    def close(self):
+        self.fluid.profiler.remove_callbacks(after=self.after_stage)
+        if self.thread is not None:
+            self.pending.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.error is None:
+            if self.compress:
+                if self.written % self.chunk:
+                    self.write_chunk(self.written // self.chunk, self.written % self.chunk)
+                else:
+                    self.write_meta(self.written)
+            else:
+                self.flush(self.written)
+        return self
+
+
+def read_meta(path):
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
+
+
+#Frame einer Aufzeichnung laden: step=None ist der letzte Frame, sonst der letzte Frame mit Schritt <= step
+#die .npy Dateien werden nur gemappt, gelesen wird nur dieser Frame (bzw. ein komprimierter Block)
+#gibt (state, forces, step) zurück
+def load_checkpoint(path, step=None):
+    meta = read_meta(path)
+    frames = meta["frames"]
+    if frames == 0:
+        raise ValueError(f"recording {path!r} contains no frames")
+
+    if meta["compress"]:
+        chunks = []
+        for i in range((frames + meta["chunk"] - 1) // meta["chunk"]):
+            with np.load(os.path.join(path, f"chunk_{i:05d}.npz")) as chunk:
+                chunks.append(chunk["steps"])
+        steps = np.concatenate(chunks)
+    else:
+        steps = np.load(os.path.join(path, "steps.npy"), mmap_mode="r")[:frames]
+
+    frame = frames - 1 if step is None else int(np.searchsorted(steps, step, side="right")) - 1
+    if frame < 0:
+        raise ValueError(f"no frame at or before step {step} in {path!r}")
+
+    if meta["compress"]:
+        with np.load(os.path.join(path, f"chunk_{frame // meta['chunk']:05d}.npz")) as chunk:
+            index = frame % meta["chunk"]
+            return chunk["state"][index], chunk["forces"][index], int(steps[frame])
+    state = np.load(os.path.join(path, "state.npy"), mmap_mode="r")
+    forces = np.load(os.path.join(path, "forces.npy"), mmap_mode="r")
+    return np.array(state[frame]), np.array(forces[frame]), int(steps[frame])
+
+
+#Simulation aus einer Aufzeichnung neu starten (mit Kräften), ohne fluid wird eine passende Simulation angelegt
+#gibt (fluid, Schritt des geladenen Frames) zurück, Tracer-Teilchen werden nicht aufgezeichnet
+def restore(path, step=None, fluid=None):
+    meta = read_meta(path)
+    state, forces, recorded_step = load_checkpoint(path, step)
+    if fluid is None:
+        fluid = FluidSimulation(meta["N"], meta["dt"], meta["visc"], order=meta["order"],
+                                batch_shape=tuple(meta["batch_shape"]), dyes=meta["dyes"])
+    if fluid.state.shape != state.shape:
+        raise ValueError(f"recording has state shape {state.shape}, simulation has {fluid.state.shape}")
+    fluid.state[...] = state
+    fluid.uforce[...] = forces[0]
+    fluid.vforce[...] = forces[1]
+    fluid.wake()
+    return fluid, recorded_step
+
+
+#Aufzeichnung (ohne Kompression) zum Auswerten öffnen: memory-mapped Arrays, nichts wird vorab gelesen
+def open_recording(path):
+    meta = read_meta(path)
+    if meta["compress"]:
+        raise ValueError("compressed recordings are read chunk by chunk with load_checkpoint")
+    frames = meta["frames"]
+    return {
+        "state": np.load(os.path.join(path, "state.npy"), mmap_mode="r")[:frames],
+        "forces": np.load(os.path.join(path, "forces.npy"), mmap_mode="r")[:frames],
+        "steps": np.load(os.path.join(path, "steps.npy"), mmap_mode="r")[:frames],
+        "meta": meta,
+    }
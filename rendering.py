@@ -0,0 +1,214 @@
+#Darstellung des Dichtefeldes über eine vorberechnete Farbtabelle (LUT) mit 256 Einträgen
+#Ohne pygame Import, das Ergebnis ist ein uint8 RGB Array (N, N, 3) in der Achsenreihenfolge von
+#pygame.surfarray (erste Achse = x). Mit out=pygame.surfarray.pixels3d(surf) wird direkt ins Surface geschrieben.
+#render_packed schreibt gepackte 32 Bit Pixel in pygame.surfarray.pixels2d(surf), dort liegt der Speicher
+#zusammenhängend und numpy kann ohne Zwischenpuffer schreiben.
+
+import numpy as np
+
+
+#Farbverläufe als Stützstellen von 0 (keine Dichte) bis 1 (maximale Dichte)
+COLORMAPS = {
+    "inferno": [(0, 0, 4), (87, 16, 110), (188, 55, 84), (249, 142, 9), (252, 255, 164)],
+    "viridis": [(68, 1, 84), (59, 82, 139), (33, 145, 140), (94, 201, 98), (253, 231, 37)],
+    "ice": [(0, 0, 0), (10, 40, 90), (40, 120, 190), (150, 210, 240), (255, 255, 255)],
+    "fire": [(0, 0, 0), (120, 10, 0), (230, 80, 0), (255, 190, 40), (255, 255, 220)],
+    "grey": [(0, 0, 0), (255, 255, 255)],
+    "coolwarm": [(59, 76, 192), (141, 176, 254), (221, 221, 221), (244, 154, 123), (180, 4, 38)],   #für Felder mit Vorzeichen
+}
+
+
+#LUT aus Stützstellen linear interpolieren, shape (256, 3) uint8
+def colormap_lut(colors):
+    colors = np.asarray(colors, dtype=np.float64)
+    anchors = np.linspace(0, 1, len(colors))
+    levels = np.linspace(0, 1, 256)
+    lut = np.stack([np.interp(levels, anchors, colors[:, c]) for c in range(3)], axis=-1)
+    return np.round(lut).astype(np.uint8)
+
+
+#LUT für eine einzelne Farbe (r, g, b), wie die RGB Slider in main.py: Helligkeit proportional zur Dichte
+def tint_lut(r, g, b):
+    levels = np.arange(256, dtype=np.float64)[:, None] / 255
+    return (levels * np.array([r, g, b], dtype=np.float64)).astype(np.uint8)
+
+
+class DensityRenderer:
+
+    def __init__(self):
+        self.lut = tint_lut(255, 255, 255)
+        self.lut_key = None         # Parameter der aktuellen LUT, damit sie nur bei Änderung neu gebaut wird
+        self.work = None            # float32 Zwischenspeicher, shape wie das Dichtefeld
+        self.index = None           # LUT Index pro Zelle (intp, sonst legt np.take eine konvertierte Kopie an)
+        self.packed = None          # uint32 LUT für render_packed
+        self.packed_key = None
+
+    #Farbe aus den RGB Slidern
+    def set_tint(self, r, g, b):
+        key = ("tint", r, g, b)
+        if key != self.lut_key:
+            self.lut = tint_lut(r, g, b)
+            self.lut_key = key
+
+    #benannter Farbverlauf aus COLORMAPS oder eigene Stützstellen / fertige (256, 3) LUT
+    def set_colormap(self, colormap):
+        if isinstance(colormap, str):
+            key = ("colormap", colormap)
+            if key != self.lut_key:
+                self.lut = colormap_lut(COLORMAPS[colormap])
+                self.lut_key = key
+            return
+        colormap = np.asarray(colormap)
+        self.lut = colormap.astype(np.uint8) if colormap.shape == (256, 3) else colormap_lut(colormap)
+        self.lut_key = None
+
+    #Feld -> LUT Index in [0, 255]
+    #scale="log": log1p(10*d) und min/max Normierung wie bisher in visualisation() (Dichte)
+    #scale="linear": min/max Normierung, scale="symmetric": -max|f|..max|f| (0 liegt in der Mitte der LUT)
+    def levels(self, density, scale="log"):
+        if self.work is None or self.work.shape != density.shape:
+            self.work = np.empty(density.shape, dtype=np.float32)
+            self.index = np.empty(density.shape, dtype=np.intp)
+        work = self.work
+
+        if scale == "log":
+            np.maximum(density, 0, out=work)        #negative Werte (Rundung der FFT) wie kleine Dichten behandeln
+            work *= 10
+            np.log1p(work, out=work)                #kleinere dichten länger darstellen
+        else:
+            np.copyto(work, density)
+        if scale == "symmetric":
+            high = max(abs(work.min()), abs(work.max()))
+            low = -high
+        else:
+            low = work.min()
+            high = work.max()
+        work -= low
+        work *= 255 / (high - low + 1e-17)
+        np.copyto(self.index, work, casting='unsafe')
+        return self.index
+
+    #Farben für das Dichtefeld in out (N, N, 3) uint8 schreiben, z.B. out=pygame.surfarray.pixels3d(surf)
+    def render(self, density, out=None, scale="log"):
+        index = self.levels(density, scale)
+        if out is None:
+            out = np.empty(density.shape + (3,), dtype=np.uint8)
+        np.take(self.lut, index, axis=0, out=out, mode='clip')
+        return out
+
+    #wie render, aber in ein 32 Bit Pixel-Array (x, y) wie pygame.surfarray.pixels2d(surf)
+    #shifts: Bitpositionen von Rot, Grün, Blau, z.B. surf.get_shifts()[:3]
+    def render_packed(self, density, out, shifts, scale="log"):
+        key = (self.lut_key, id(self.lut), tuple(shifts))
+        if key != self.packed_key:
+            lut = self.lut.astype(np.uint32)
+            self.packed = (lut[:, 0] << shifts[0]) | (lut[:, 1] << shifts[1]) | (lut[:, 2] << shifts[2])
+            self.packed_key = key
+
+        #pixels2d hat die Form (x, y) mit zusammenhängenden Zeilen entlang x, also transponiert rechnen
+        index = self.levels(density.T, scale)
+        np.take(self.packed, index, out=out.T, mode='clip')
+        return out
+
+
+#Standardfarben der Farbstoffe (werden bei mehr Farbstoffen wiederholt)
+DYE_COLOURS = [(255, 40, 40), (40, 255, 60), (60, 90, 255), (255, 220, 40),
+               (255, 40, 220), (40, 230, 255), (255, 140, 20), (255, 255, 255)]
+
+
+#Farben für C Farbstoffe, shape (C, 3)
+def dye_colours(count, colours=None):
+    colours = DYE_COLOURS if colours is None else colours
+    return np.array([colours[c % len(colours)] for c in range(count)], dtype=np.float32).reshape(count, 3)
+
+
+#Additive Mischung von C Farbstoffen (C, N, N): RGB = Summe Konzentration_c * Farbe_c, auf 0..255 begrenzt
+#die Mischung ist ein Matrixprodukt (3, C) x (C, N*N) in einen vorallokierten float32 Puffer
+class DyeRenderer:
+
+    def __init__(self):
+        self.work = None            # float32 (3, N, N) RGB
+        self.channel = None         # uint32 Zwischenspeicher für einen Farbkanal
+        self.packed = None          # uint32 gepackte Pixel
+
+    def mix(self, dyes, colours=None, gain=1.0):
+        count = dyes.shape[0]
+        if self.work is None or self.work.shape[1:] != dyes.shape[1:]:
+            self.work = np.empty((3,) + dyes.shape[1:], dtype=np.float32)
+            self.channel = np.empty(dyes.shape[1:], dtype=np.uint32)
+            self.packed = np.empty(dyes.shape[1:], dtype=np.uint32)
+        weights = np.ascontiguousarray(dye_colours(count, colours).T * np.float32(gain))
+        np.dot(weights, dyes.reshape(count, -1), out=self.work.reshape(3, -1))
+        np.clip(self.work, 0, 255, out=self.work)
+        return self.work
+
+    #Farben nach out (N, N, 3) uint8 schreiben, Achsen wie bei DensityRenderer.render
+    def render(self, dyes, colours=None, out=None, gain=1.0):
+        work = self.mix(dyes, colours, gain)
+        if out is None:
+            out = np.empty(dyes.shape[1:] + (3,), dtype=np.uint8)
+        np.copyto(out, np.moveaxis(work, 0, -1), casting='unsafe')
+        return out
+
+    #gepackte 32 Bit Pixel nach out, z.B. pygame.surfarray.pixels2d(surf), shifts wie bei render_packed
+    def render_packed(self, dyes, out, shifts, colours=None, gain=1.0):
+        work = self.mix(dyes, colours, gain)
+        self.packed.fill(0)
+        for c in range(3):
+            np.copyto(self.channel, work[c], casting='unsafe')
+            self.channel <<= shifts[c]
+            self.packed |= self.channel
+        np.copyto(out, self.packed)
+        return out
+
+
+#Farbe als gepackter 32 Bit Pixelwert, shifts wie bei render_packed
+def pack_colour(colour, shifts):
+    r, g, b = colour[:3]
+    return (int(r) << shifts[0]) | (int(g) << shifts[1]) | (int(b) << shifts[2])
+
+
+#Start- und Endpunkte (in Pixeln) der Geschwindigkeitspfeile für jede step-te Zelle, in einem numpy Durchgang
+#Achsen wie im Fenster: erste Achse = x, Pfeile länger als max_speed werden gekürzt und um length gestreckt
+def velocity_glyphs(u, v, step, scaling_factor, max_speed=2.0, length=5):
+    N = u.shape[-1]
+    cells = np.arange(0, N, step)
+    I, J = np.meshgrid(cells, cells, indexing='ij')
+    gx = v[::step, ::step].astype(np.float64)       #Fensterachse x entspricht der ersten Feldachse (v)
+    gy = u[::step, ::step].astype(np.float64)
+
+    speed = np.hypot(gx, gy)
+    factor = np.minimum(1.0, max_speed / np.maximum(speed, 1e-30))
+    gx *= factor
+    gy *= factor
+
+    starts = np.stack([I * scaling_factor, J * scaling_factor], axis=-1).reshape(-1, 2)
+    ends = np.stack([np.trunc((I + gx * length) * scaling_factor),
+                     np.trunc((J + gy * length) * scaling_factor)], axis=-1).reshape(-1, 2)
+    return starts, ends
+
+
+#Punktwolke (z.B. Tracer-Teilchen) in ein Pixel-Array (x, y) zeichnen, Positionen in Zellen, skaliert auf Pixel
+def draw_points(pixels, x, y, scaling_factor, value):
+    width, height = pixels.shape[:2]
+    px = (x * scaling_factor).astype(np.intp)
+    py = (y * scaling_factor).astype(np.intp)
+    inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+    pixels[px[inside], py[inside]] = value
+    return pixels
+
+
+#Liniensegmente auf einmal in ein Pixel-Array (x, y) zeichnen, z.B. pygame.surfarray.pixels2d(surf)
+#jede Linie wird an max(|dx|, |dy|)+1 Punkten abgetastet, Punkte außerhalb werden verworfen
+def draw_segments(pixels, starts, ends, value):
+    if len(starts) == 0:
+        return pixels
+    delta = ends - starts
+    samples = int(np.abs(delta).max()) + 1
+    t = np.linspace(0.0, 1.0, samples + 1)
+    points = np.rint(starts[:, None, :] + t[None, :, None] * delta[:, None, :]).astype(np.intp).reshape(-1, 2)
+
+    width, height = pixels.shape[:2]
+    inside = (points[:, 0] >= 0) & (points[:, 0] < width) & (points[:, 1] >= 0) & (points[:, 1] < height)
+    pixels[points[inside, 0], points[inside, 1]] = value
+    return pixels
@@ -0,0 +1,234 @@
+#Aufzeichnung aller Eingaben einer Sitzung und deterministische Wiedergabe ohne Fenster
+#Jede Eingabe aus main.py läuft über solver.submit(fn, *args). RecordingSolver reicht sie weiter und InputLog
+#protokolliert sie dort, wo sie wirklich ausgeführt wird (im Löser, auch im Thread-Modus), zusammen mit der Anzahl
+#der bis dahin gerechneten Schritte. Radius, Kraft, Farbstoff usw. stecken in den Argumenten, dt/visc in
+#set_parameters, Auflösungswechsel werden als "resize" protokolliert.
+#Die Ereignisdatei ist ein kleines .npz (Schritt, Aktion und bis zu MAX_ARGS Zahlen pro Ereignis).
+#Die Wiedergabe führt die Ereignisse an denselben Schritten aus und rechnet so schnell wie möglich,
+#gibt die Zeit jedes Schritts und eine Prüfsumme des Endzustands aus (stimmt mit der Aufnahme überein).
+#
+#Beispiel:
+#   python main.py --record-input session.npz
+#   python replay.py session.npz --timings timings.npy
+
+import argparse
+import hashlib
+import time
+import numpy as np
+from fluid_class import FluidSimulation
+from headless import inject_density, inject_dye, inject_force, emit_particles, set_parameters
+
+
+MAX_ARGS = 6
+
+#Aktionen, die protokolliert werden können: Name in der Ereignisdatei -> fn(fluid, *args)
+ACTIONS = {
+    "density": inject_density,
+    "dye": inject_dye,
+    "force": inject_force,
+    "particles": emit_particles,
+    "parameters": set_parameters,
+    "clear": FluidSimulation.clear,
+    "resize": FluidSimulation.resize,
+}
+ACTION_NAMES = {fn: name for name, fn in ACTIONS.items()}
+
+
+#SHA-256 über den Zustand (u, v, Dichte, Farbstoffe), die Kräfte und die Tracer-Teilchen
+def state_checksum(fluid):
+    digest = hashlib.sha256()
+    for array in (fluid.state, fluid.uforce, fluid.vforce):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    if fluid.particles is not None:
+        count = fluid.particles.count
+        for array in (fluid.particles.x, fluid.particles.y, fluid.particles.age):
+            digest.update(array[:count].tobytes())
+    return digest.hexdigest()
+
+
+#zählt die Schritte der Simulation über den Profiler-Callback (wie StateRecorder)
+class StepCounter:
+
+    def __init__(self, fluid):
+        self.fluid = fluid
+        self.count = 0
+        fluid.add_stage_callbacks(after=self.after_stage)
+
+    def after_stage(self, name, seconds):
+        if name == "step":
+            self.count += 1
+
+    def close(self):
+        self.fluid.profiler.remove_callbacks(after=self.after_stage)
+
+
+#Protokoll der Eingaben, muss vor dem ersten Schritt an eine frische Simulation gehängt werden
+class InputLog:
+
+    def __init__(self, fluid, seed=None):
+        self.fluid = fluid
+        self.counter = StepCounter(fluid)
+        self.events = []                    # (Schritt, Aktion, Argumente)
+
+        #Startwerte der Simulation, damit die Wiedergabe dieselbe Simulation anlegt
+        self.meta = {
+            "N": fluid.N, "dt": fluid.dt, "visc": fluid.visc, "order": fluid.order,
+            "dyes": fluid.channels - 3, "cfl": fluid.cfl, "max_substeps": fluid.max_substeps, "interval": fluid.interval,
+            "particles": 0, "lifetime": None, "particle_order": 1, "seed": 0, "threads": fluid.threads,
+            "idle_velocity": None, "idle_force": None, "idle_density": None, "idle_check_every": None,
+        }
+        if fluid.activity is not None:
+            #das Überspringen ruhender Schritte setzt kleine Werte auf 0, die Wiedergabe braucht dieselben Schwellen
+            self.meta.update(idle_velocity=fluid.activity.velocity, idle_force=fluid.activity.force,
+                             idle_density=fluid.activity.density, idle_check_every=fluid.activity.check_every)
+        if fluid.particles is not None:
+            #die Streuung neuer Teilchen ist zufällig, mit festem Seed ist sie reproduzierbar
+            seed = int(np.random.SeedSequence(seed).generate_state(1)[0])
+            fluid.particles.rng = np.random.default_rng(seed)
+            self.meta.update(particles=fluid.particles.capacity, lifetime=fluid.particles.lifetime,
+                             particle_order=fluid.particles.order, seed=seed)
+
+    #Aktion protokollieren und ausführen, läuft dort, wo der Löser Eingaben ausführt
+    def apply(self, fluid, fn, args):
+        name = ACTION_NAMES[fn]
+        self.events.append((self.counter.count, name, args))
+        fn(fluid, *args)
+
+    #Ereignisdatei schreiben (nach solver.stop()), mit Endschritt und Prüfsumme des Zustands
+    def save(self, path):
+        count = len(self.events)
+        names = list(ACTIONS)
+        steps = np.array([event[0] for event in self.events], dtype=np.int64)
+        actions = np.array([names.index(event[1]) for event in self.events], dtype=np.uint8)
+        args = np.zeros((count, MAX_ARGS), dtype=np.float64)
+        integers = np.zeros(count, dtype=np.uint8)          #Bit i gesetzt: Argument i ist eine ganze Zahl
+        lengths = np.zeros(count, dtype=np.uint8)
+        for i, (_, _, values) in enumerate(self.events):
+            lengths[i] = len(values)
+            for j, value in enumerate(values):
+                args[i, j] = value
+                if isinstance(value, (int, np.integer)):
+                    integers[i] |= 1 << j
+        np.savez_compressed(path, actions_names=np.array(names), steps=steps, actions=actions, args=args,
+                            integers=integers, lengths=lengths, end=self.counter.count,
+                            checksum=state_checksum(self.fluid),
+                            **{key: np.array(np.nan if value is None else value) for key, value in self.meta.items()})
+
+    def close(self):
+        self.counter.close()
+
+
+#Löser (SyncSolver oder SimulationThread), dessen Eingaben in log protokolliert werden, sonst unverändert
+class RecordingSolver:
+
+    def __init__(self, solver, log):
+        self.solver = solver
+        self.log = log
+
+    def submit(self, fn, *args):
+        if fn not in ACTION_NAMES:
+            raise ValueError(f"{fn.__name__} is not a recordable action")
+        if len(args) > MAX_ARGS:
+            raise ValueError(f"{fn.__name__}: at most {MAX_ARGS} arguments can be recorded")
+        self.solver.submit(self.log.apply, fn, args)
+
+    def __getattr__(self, name):
+        return getattr(self.solver, name)
+
+
+#Ereignisdatei lesen, gibt (meta, Liste von (Schritt, fn, Argumente)) zurück
+def load_log(path):
+    with np.load(path) as data:
+        names = [str(name) for name in data["actions_names"]]
+        events = []
+        for step, action, values, integers, length in zip(data["steps"], data["actions"], data["args"],
+                                                          data["integers"], data["lengths"]):
+            args = tuple(int(values[j]) if integers >> j & 1 else float(values[j]) for j in range(length))
+            events.append((int(step), ACTIONS[names[action]], args))
+        meta = {key: data[key][()] for key in ("N", "dt", "visc", "order", "dyes", "cfl", "max_substeps",
+                                                "particles", "lifetime", "particle_order", "seed", "end",
+                                                "idle_velocity", "idle_force", "idle_density", "idle_check_every",
+                                                "threads", "interval") if key in data}
+        meta = {key: None if isinstance(value, float) and np.isnan(value) else value.item()
+                for key, value in meta.items()}
+        meta["checksum"] = str(data["checksum"])
+    return meta, events
+
+
+#Sitzung ohne Fenster so schnell wie möglich wiedergeben
+#threads: Standard wie bei der Aufnahme, FFTs mit mehreren Threads (scipy) runden anders als numpy,
+#mit einer anderen Anzahl stimmt die Prüfsumme daher im Allgemeinen nicht
+#gibt Statistik mit der Zeit jedes Schritts ("timings", Sekunden) und der Prüfsumme des Endzustands zurück
+def replay(path, threads=None):
+    meta, events = load_log(path)
+    if threads is None:
+        threads = meta.get("threads", 1)
+    fluid = FluidSimulation(meta["N"], meta["dt"], meta["visc"], order=meta["order"], threads=threads, dyes=meta["dyes"])
+    fluid.cfl = meta["cfl"]
+    fluid.max_substeps = meta["max_substeps"]
+    fluid.interval = meta.get("interval")
+    if meta["particles"]:
+        fluid.add_particles(meta["particles"], meta["lifetime"], meta["seed"], meta["particle_order"])
+    if meta["idle_check_every"] is not None:
+        fluid.add_activity_tracker(meta["idle_velocity"], meta["idle_force"], meta["idle_density"],
+                                   int(meta["idle_check_every"]))
+
+    end = meta["end"]
+    timings = np.zeros(end)
+    counter = StepCounter(fluid)
+
+    def record_timing(name, seconds):
+        if name == "step" and counter.count <= end:
+            timings[counter.count - 1] = seconds
+    fluid.add_stage_callbacks(after=record_timing)
+
+    start = time.perf_counter()
+    index = 0
+    while True:
+        #Ereignisse liegen immer zwischen zwei fluid.advance(), also an denselben Schrittgrenzen wie bei der Aufnahme
+        while index < len(events) and events[index][0] <= counter.count:
+            _, fn, args = events[index]
+            fn(fluid, *args)
+            index += 1
+        if counter.count >= end:
+            break
+        fluid.advance()
+    elapsed = time.perf_counter() - start
+    counter.close()
+    fluid.profiler.remove_callbacks(after=record_timing)
+
+    checksum = state_checksum(fluid)
+    return {
+        "steps": counter.count,
+        "events": len(events),
+        "seconds": elapsed,
+        "steps_per_second": counter.count / elapsed if elapsed > 0 else float("inf"),
+        "timings": timings,
+        "checksum": checksum,
+        "match": checksum == meta["checksum"],
+        "fluid": fluid,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded session without a window.")
+    parser.add_argument("log", help="event file written by main.py --record-input")
+    parser.add_argument("--threads", type=int, help="threads for FFTs and row-blocked advection (default: as recorded)")
+    parser.add_argument("--timings", help="write the time of every step (seconds) to this .npy file")
+    args = parser.parse_args(argv)
+
+    stats = replay(args.log, args.threads)
+    timings = stats["timings"] * 1e3
+    print(f"steps={stats['steps']}  events={stats['events']}  time={stats['seconds']:.3f}s  "
+          f"{stats['steps_per_second']:.1f} steps/s")
+    if len(timings):
+        print(f"step [ms]: mean {timings.mean():.2f}  p50 {np.percentile(timings, 50):.2f}  "
+              f"p95 {np.percentile(timings, 95):.2f}  max {timings.max():.2f}")
+    print(f"checksum {stats['checksum']}  {'matches' if stats['match'] else 'DIFFERS from'} the recording")
+    if args.timings:
+        np.save(args.timings, stats["timings"])
+    return stats
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#Entkopplung von Simulation und Darstellung
+#SyncSolver rechnet wie bisher im Render-Loop, SimulationThread rechnet in einem eigenen Thread
+#(numpy FFTs und scipy geben den GIL frei) und stellt fertige Frames über einen Dreifachpuffer bereit.
+#Beide haben dieselbe Schnittstelle, damit main.py mit beiden Modi gleich aussieht:
+#   solver.submit(fn, *args)  -> fn(fluid, *args) wird vor dem nächsten Schritt im Löser ausgeführt
+#   solver.advance()          -> im synchronen Modus substeps mal fluid.advance(), im Thread-Modus nichts
+#   with solver.snapshot() as (u, v, density, dyes, tracers): ...   -> letzter fertiger Zustand zum Zeichnen
+#        (dyes: (C, N, N), tracers: Positionen (x, y) der aktiven Tracer-Teilchen oder None ohne Teilchen)
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+
+class SyncSolver:
+
+    def __init__(self, fluid, substeps=1):
+        self.fluid = fluid
+        self.substeps = substeps    # Simulationsschritte pro angezeigtem Frame
+        self.frame = 0
+
+    def submit(self, fn, *args):
+        fn(self.fluid, *args)
+
+    def advance(self):
+        for _ in range(self.substeps):
+            self.fluid.advance()
+        self.frame += 1
+
+    @contextmanager
+    def snapshot(self):
+        particles = self.fluid.particles
+        yield (self.fluid.u, self.fluid.v, self.fluid.density, self.fluid.dyes,
+               particles.positions() if particles is not None else None)
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+
+class SimulationThread:
+
+    def __init__(self, fluid, substeps=1, frame_interval=None):
+        self.fluid = fluid
+        self.substeps = substeps              # Simulationsschritte pro veröffentlichtem Frame
+        self.frame_interval = frame_interval  # minimale Zeit pro Frame in Sekunden, None = so schnell wie möglich
+        self.commands = queue.SimpleQueue()   # Eingaben aus dem Render-Loop (Maus, Parameter)
+
+        #Dreifachpuffer für den Zustand (u, v, density, Farbstoffe): einer wird gelesen, einer ist der neueste, in den dritten wird geschrieben
+        self.buffers = np.zeros((3,) + fluid.state.shape, dtype=fluid.state.dtype)
+        #dazu die Positionen der Tracer-Teilchen, der Löser bewegt und verdichtet die Arrays in fluid.particles laufend
+        self.tracers = None
+        self.tracer_counts = [0, 0, 0]
+        if fluid.particles is not None:
+            self.tracers = np.zeros((3, 2, fluid.particles.capacity), dtype=np.float32)
+        self.latest = 0             # Index des neuesten fertigen Frames
+        self.reading = None         # Index des Puffers, der gerade gezeichnet wird
+        self.lock = threading.Lock()
+
+        self.frame = 0              # Anzahl veröffentlichter Frames
+        self.running = False
+        self.error = None
+        self.thread = None
+
+    def submit(self, fn, *args):
+        self.commands.put((fn, args))
+
+    #Schritte laufen im Thread, im Render-Loop ist nichts zu tun
+    def advance(self):
+        if self.error is not None:
+            raise RuntimeError("solver thread failed") from self.error
+
+    #liefert den neuesten fertigen Frame, der Puffer wird solange nicht überschrieben
+    @contextmanager
+    def snapshot(self):
+        with self.lock:
+            self.reading = self.latest
+        try:
+            frame = self.buffers[self.reading]
+            tracers = None
+            if self.tracers is not None:
+                count = self.tracer_counts[self.reading]
+                tracers = (self.tracers[self.reading, 0, :count], self.tracers[self.reading, 1, :count])
+            yield frame[0], frame[1], frame[2], frame[3:], tracers
+        finally:
+            with self.lock:
+                self.reading = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="fluid-solver", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    #alle wartenden Eingaben vor dem nächsten Schritt anwenden
+    def apply_commands(self):
+        while True:
+            try:
+                fn, args = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            fn(self.fluid, *args)
+
+    #Zustand in einen freien Puffer kopieren und als neuesten Frame veröffentlichen
+    def publish(self):
+        with self.lock:
+            target = next(i for i in range(3) if i != self.latest and i != self.reading)
+        np.copyto(self.buffers[target], self.fluid.state)
+        if self.tracers is not None:
+            x, y = self.fluid.particles.positions()
+            self.tracers[target, 0, :len(x)] = x
+            self.tracers[target, 1, :len(y)] = y
+            self.tracer_counts[target] = len(x)
+        with self.lock:
+            self.latest = target
+            self.frame += 1
+
+    def run(self):
+        try:
+            while self.running:
+                start = time.perf_counter()
+                self.apply_commands()
+                for _ in range(self.substeps):
+                    self.fluid.advance()
+                self.publish()
+
+                if self.frame_interval is not None:
+                    remaining = self.frame_interval - (time.perf_counter() - start)
+                    if remaining > 0:
+                        time.sleep(remaining)
+        except Exception as e:
+            self.error = e
+            self.running = False